@@ -0,0 +1,205 @@
+
+"""
+Frame stacking without copying stacked observations (render_test.py runs
+num_img_obs=4): each frame is stored once, and stacks are views or gathered
+by index.
+
+FrameStacker (acting): a mirrored ring of 2 * n_stack slots per
+environment; each frame is written at slot p and p + n_stack (p = step mod
+n_stack), so the last n_stack frames, oldest first, are always the
+contiguous slots p + 1 ... p + n_stack: a strided view, with two frame
+writes per step instead of shifting the whole stack.  A new episode's stack
+starts as zeros and its first frame, [0, 0, 0, f0], as replay rebuilds it.
+
+FrameReplayBuffer (replay): a ring of single frames, (capacity, n_envs) +
+frame shape, with actions, rewards and dones per step.  Sampling gathers
+each stack by index and zeroes frames from before the episode start, so
+84x84 uint8 replay takes about 1/n_stack the memory of storing stacks.
+
+Usage:
+    stacker = FrameStacker(n_envs, n_stack=4)
+    obs = stacker.reset(frames)                    # (n_envs, 4, 84, 84) view
+    obs = stacker.push(frames, done)
+    replay = FrameReplayBuffer(1000000 // n_envs, n_envs)
+    replay.append(frames, act, rew, done)          # (frames: obs at this step)
+    obs, act, rew, done, next_obs = replay.sample(32)
+"""
+
+import sys
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+SIZE = (84, 84)
+
+
+class FrameStacker(object):
+
+    def __init__(self, n_envs, n_stack=4, frame_shape=SIZE, dtype=np.uint8):
+        self.n_stack = n_stack
+        self._ring = np.zeros((n_envs, 2 * n_stack) + tuple(frame_shape), dtype=dtype)
+        self._pos = n_stack - 1  # (slot of the newest frame)
+
+    @property
+    def stacked(self):
+        """ (n_envs, n_stack) + frame_shape view, oldest frame first
+        (changes on the next push). """
+        return self._ring[:, self._pos + 1:self._pos + 1 + self.n_stack]
+
+    def reset(self, frames):
+        """ Start every stack with its environment's first frame (older
+        frames zero). """
+        self._ring[:] = 0
+        self._ring[:, self._pos] = frames
+        self._ring[:, self._pos + self.n_stack] = frames
+        return self.stacked
+
+    def push(self, frames, done=None):
+        """ Add each environment's newest frame; environments with done set
+        (just reset) start a fresh stack (older frames zero). """
+        if done is not None and np.any(done):
+            self._ring[done] = 0
+        p = (self._pos + 1) % self.n_stack
+        self._ring[:, p] = frames
+        self._ring[:, p + self.n_stack] = frames
+        self._pos = p
+        return self.stacked
+
+
+class FrameReplayBuffer(object):
+    """ capacity: time steps kept (for each of n_envs environments). """
+
+    def __init__(self, capacity, n_envs, n_stack=4, frame_shape=SIZE, frame_dtype=np.uint8,
+                 act_shape=(), act_dtype=np.int64):
+        self.capacity = capacity
+        self.n_envs = n_envs
+        self.n_stack = n_stack
+        self.frames = np.zeros((capacity, n_envs) + tuple(frame_shape), dtype=frame_dtype)
+        self.act = np.zeros((capacity, n_envs) + tuple(act_shape), dtype=act_dtype)
+        self.rew = np.zeros((capacity, n_envs), dtype=np.float32)
+        self.done = np.zeros((capacity, n_envs), dtype=bool)
+        self.first = np.zeros((capacity, n_envs), dtype=bool)  # (frame starts an episode)
+        self._prev_done = np.ones(n_envs, dtype=bool)
+        self.t = 0  # (steps appended in total)
+
+    @property
+    def nbytes(self):
+        return sum(x.nbytes for x in (self.frames, self.act, self.rew, self.done, self.first))
+
+    def append(self, frames, act, rew, done):
+        """ One step of all environments: the frames observed, the actions
+        taken, and the resulting rewards and dones. """
+        i = self.t % self.capacity
+        self.frames[i] = frames
+        self.act[i] = act
+        self.rew[i] = rew
+        self.done[i] = done
+        self.first[i] = self._prev_done
+        self._prev_done = np.asarray(done, dtype=bool)
+        self.t += 1
+
+    def stack(self, t, env):
+        """ Stacked observations (len(t), n_stack) + frame_shape at steps t
+        (absolute) of environments env, frames from earlier episodes zeroed. """
+        back = np.arange(self.n_stack - 1, -1, -1)  # (oldest first)
+        idx = (t[:, None] - back) % self.capacity
+        env = env[:, None]
+        obs = self.frames[idx, env]
+        # Frame t - k is stale if any frame after it (up to t) started an episode.
+        first = self.first[idx, env]
+        stale = np.logical_or.accumulate(first[:, :0:-1], axis=1)[:, ::-1]
+        obs[:, :-1][stale] = 0
+        return obs
+
+    def sample(self, batch_size, rng=np.random):
+        """ Random transitions: (obs, act, rew, done, next_obs), with obs and
+        next_obs gathered as stacks. """
+        oldest = max(0, self.t - self.capacity) + self.n_stack - 1  # (full history kept)
+        newest = self.t - 2  # (next frame stored)
+        if newest < oldest:
+            raise ValueError("Not enough steps stored to sample ({}).".format(self.t))
+        t = rng.randint(oldest, newest + 1, batch_size)
+        env = rng.randint(0, self.n_envs, batch_size)
+        i = t % self.capacity
+        return (self.stack(t, env), self.act[i, env], self.rew[i, env], self.done[i, env],
+                self.stack(t + 1, env))
+
+
+###############################################################################
+# Benchmark: stacking by shifting and replay of stacks vs. frame rings.      #
+###############################################################################
+
+
+def check_stacks(n_envs=4, n_steps=200, capacity=50, p_done=0.1, seed=0):
+    """ Replay must rebuild exactly the stacks the stacker gave for acting. """
+    rng = np.random.RandomState(seed)
+    frames = rng.randint(1, 256, (n_steps, n_envs, 2, 2)).astype(np.uint8)
+    done = rng.rand(n_steps, n_envs) < p_done
+    stacker = FrameStacker(n_envs, frame_shape=(2, 2))
+    replay = FrameReplayBuffer(capacity, n_envs, frame_shape=(2, 2))
+    acted = []
+    for t in range(n_steps):
+        obs = stacker.reset(frames[t]) if t == 0 else stacker.push(frames[t], done[t - 1])
+        acted.append(obs.copy())
+        replay.append(frames[t], 0, 0., done[t])
+    envs = np.arange(n_envs)
+    for t in range(n_steps - capacity + 3, n_steps):
+        assert np.array_equal(replay.stack(np.full(n_envs, t), envs), acted[t]), t
+
+
+def main(n_envs, n_steps, capacity, batch_size):
+    rng = np.random.RandomState(0)
+    frames = rng.randint(0, 256, (16, n_envs) + SIZE).astype(np.uint8)
+    done = rng.rand(n_steps, n_envs) < 0.01
+    check_stacks()
+    print("{} envs, {} steps, replay capacity {} steps/env, batch {}".format(
+        n_envs, n_steps, capacity, batch_size))
+
+    stacked = np.zeros((n_envs, 4) + SIZE, dtype=np.uint8)
+    stack_replay = np.zeros((capacity, n_envs, 4) + SIZE, dtype=np.uint8)
+    t_start = timer()
+    for t in range(n_steps):
+        stacked[:, :-1] = stacked[:, 1:]  # (shift: copy 4 frames per step)
+        stacked[:, -1] = frames[t % 16]
+        stacked[done[t], :-1] = 0
+        stack_replay[t % capacity] = stacked
+    t_shift = timer() - t_start
+    t_start = timer()
+    for _ in range(100):
+        i = rng.randint(0, min(n_steps, capacity), batch_size)
+        e = rng.randint(0, n_envs, batch_size)
+        stack_replay[i, e]
+    t_sample_stacks = (timer() - t_start) / 100
+
+    stacker = FrameStacker(n_envs)
+    replay = FrameReplayBuffer(capacity, n_envs)
+    act = np.zeros(n_envs, dtype=np.int64)
+    rew = np.zeros(n_envs, dtype=np.float32)
+    t_start = timer()
+    for t in range(n_steps):
+        stacker.push(frames[t % 16], done[t])
+        replay.append(frames[t % 16], act, rew, done[t])
+    t_ring = timer() - t_start
+    t_start = timer()
+    for _ in range(100):
+        replay.sample(batch_size)
+    t_sample_ring = (timer() - t_start) / 100
+
+    print("{:<24}{:>14}{:>16}{:>14}".format("", "us/step", "sample (ms)", "replay (MB)"))
+    print("{:<24}{:>14.1f}{:>16.3f}{:>14.0f}".format("shifted stacks", t_shift / n_steps * 1e6,
+                                                     t_sample_stacks * 1e3, stack_replay.nbytes / 2 ** 20))
+    print("{:<24}{:>14.1f}{:>16.3f}{:>14.0f}".format("frame rings", t_ring / n_steps * 1e6,
+                                                     t_sample_ring * 1e3, replay.nbytes / 2 ** 20))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_envs', type=int, default=16)
+    parser.add_argument('-s', '--n_steps', type=int, default=2000)
+    parser.add_argument('-c', '--capacity', type=int, default=1000)
+    parser.add_argument('-b', '--batch_size', type=int, default=32)
+    args = parser.parse_args()
+    main(args.n_envs, args.n_steps, args.capacity, args.batch_size)
@@ -0,0 +1,189 @@
+
+"""
+Batch preprocessing of Atari frames: max of the last two raw frames,
+grayscale, downsample to 84x84, and frame stacking (frame_buffer.py), for
+all environments' frames at once, writing into preallocated uint8 output
+(resize_speed.py times cv2.resize one image at a time).
+
+Backends:
+    'numpy'  whole-chunk operations: uint8 max, grayscale with out= ufuncs,
+             and area downsampling as two batched matmuls with fixed
+             resampling matrices (Ry @ gray @ Rx.T, which is what
+             cv2.INTER_AREA computes for these non-integer scales)
+    'cv2'    cv2.cvtColor and cv2.resize(INTER_AREA) per image, into the
+             output (cv2 releases the GIL)
+The batch is split into one chunk per thread of a pool; numpy's matmul and
+ufuncs release the GIL too, so both backends run in parallel.
+
+Usage:
+    prep = FramePreprocessor(n_envs=16, n_stack=4, n_threads=4)
+    obs = prep.reset(frames)                       # (16, 4, 84, 84) uint8
+    obs = prep.step(frames, last_frames, done)     # (view: valid until next call)
+"""
+
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from frame_buffer import FrameStacker
+
+
+FRAME_SHAPE = (210, 160, 3)
+SIZE = (84, 84)
+GRAY = np.array([0.299, 0.587, 0.114], dtype=np.float32)  # (RGB, as cv2.COLOR_RGB2GRAY)
+BACKENDS = ['numpy', 'cv2']
+
+
+def area_matrix(n_in, n_out):
+    """ (n_out, n_in) weights: each output pixel averages the input interval
+    it covers (fractional overlap at the edges). """
+    scale = n_in / n_out
+    edges = np.arange(n_out + 1) * scale
+    lo, hi = edges[:-1, None], edges[1:, None]
+    pixels = np.arange(n_in)[None, :]
+    overlap = np.clip(np.minimum(hi, pixels + 1) - np.maximum(lo, pixels), 0, None)
+    return (overlap / scale).astype(np.float32)
+
+
+class FramePreprocessor(object):
+    """ Preprocess and stack frames of n_envs environments.
+
+    n_threads: chunks of the batch processed in parallel (1: no pool).
+    """
+
+    def __init__(self, n_envs, n_stack=4, size=SIZE, frame_shape=FRAME_SHAPE, n_threads=1,
+                 backend='numpy'):
+        if backend not in BACKENDS:
+            raise ValueError("Unrecognized backend: {}, available: {}".format(backend, BACKENDS))
+        if backend == 'cv2' and cv2 is None:
+            raise ImportError("Backend 'cv2' needs OpenCV (cv2) installed.")
+        self.n_envs = n_envs
+        self.n_stack = n_stack
+        self.size = tuple(size)
+        self.backend = backend
+        height, width = frame_shape[:2]
+        self._Ry = area_matrix(height, self.size[0])
+        self._RxT = np.ascontiguousarray(area_matrix(width, self.size[1]).T)
+        self._raw = np.empty((n_envs,) + tuple(frame_shape), dtype=np.uint8)  # (two-frame max)
+        if backend == 'numpy':
+            self._gray = np.empty((n_envs, height, width), dtype=np.float32)
+            self._tmp = np.empty((n_envs, height, width), dtype=np.float32)
+            self._rows = np.empty((n_envs, self.size[0], width), dtype=np.float32)
+            self._small = np.empty((n_envs,) + self.size, dtype=np.float32)
+        else:
+            self._gray = np.empty((n_envs, height, width), dtype=np.uint8)
+        self.frames = np.empty((n_envs,) + self.size, dtype=np.uint8)  # (latest, unstacked)
+        self._stacker = FrameStacker(n_envs, n_stack, self.size)
+        bounds = np.linspace(0, n_envs, min(n_threads, n_envs) + 1).astype(int)
+        self._chunks = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self._pool = ThreadPoolExecutor(len(self._chunks)) if len(self._chunks) > 1 else None
+
+    def process(self, frames, last_frames=None):
+        """ Preprocessed (n_envs,) + size uint8 frames (self.frames), from
+        raw (n_envs,) + frame_shape frames; with last_frames, of their max. """
+        run = self._chunk_numpy if self.backend == 'numpy' else self._chunk_cv2
+        if self._pool is None:
+            run(frames, last_frames, 0, self.n_envs)
+        else:
+            list(self._pool.map(lambda c: run(frames, last_frames, *c), self._chunks))
+        return self.frames
+
+    def _chunk_numpy(self, frames, last_frames, lo, hi):
+        raw = frames[lo:hi]
+        if last_frames is not None:
+            raw = np.maximum(raw, last_frames[lo:hi], out=self._raw[lo:hi])
+        gray, tmp = self._gray[lo:hi], self._tmp[lo:hi]
+        np.multiply(raw[..., 0], GRAY[0], out=gray)
+        for c in (1, 2):
+            np.multiply(raw[..., c], GRAY[c], out=tmp)
+            np.add(gray, tmp, out=gray)
+        np.matmul(self._Ry, gray, out=self._rows[lo:hi])
+        small = np.matmul(self._rows[lo:hi], self._RxT, out=self._small[lo:hi])
+        np.add(small, 0.5, out=small)  # (round on the truncating cast)
+        np.copyto(self.frames[lo:hi], small, casting='unsafe')
+
+    def _chunk_cv2(self, frames, last_frames, lo, hi):
+        raw = frames[lo:hi]
+        if last_frames is not None:
+            raw = np.maximum(raw, last_frames[lo:hi], out=self._raw[lo:hi])
+        dsize = (self.size[1], self.size[0])
+        for i in range(hi - lo):
+            gray = cv2.cvtColor(raw[i], cv2.COLOR_RGB2GRAY, dst=self._gray[lo + i])
+            cv2.resize(gray, dsize, dst=self.frames[lo + i], interpolation=cv2.INTER_AREA)
+
+    def reset(self, frames, last_frames=None):
+        """ Start every environment's stack with its first frame (older
+        frames zero, as frame_buffer.FrameReplayBuffer rebuilds them). """
+        return self._stacker.reset(self.process(frames, last_frames))
+
+    @property
+    def stacked(self):
+        return self._stacker.stacked
+
+    def step(self, frames, last_frames=None, done=None):
+        """ Push the new frames onto the stacks (oldest first); environments
+        with done set (just reset) start a fresh stack (older frames zero). """
+        return self._stacker.push(self.process(frames, last_frames), done)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+###############################################################################
+# Benchmark: per-image loop vs. batch numpy vs. batch cv2, threads.          #
+###############################################################################
+
+
+def preprocess_one(frame, last_frame, Ry, RxT):
+    """ Per-image reference (as in resize_speed.py): fresh arrays each call. """
+    raw = np.maximum(frame, last_frame)
+    if cv2 is not None:
+        return cv2.resize(cv2.cvtColor(raw, cv2.COLOR_RGB2GRAY), SIZE[::-1], interpolation=cv2.INTER_AREA)
+    return np.rint(Ry.dot(raw.dot(GRAY)).dot(RxT)).astype(np.uint8)
+
+
+def main(n_envs, thread_counts, n_itr):
+    frames = np.random.randint(0, 256, (n_envs,) + FRAME_SHAPE, dtype=np.uint8)
+    last_frames = np.random.randint(0, 256, (n_envs,) + FRAME_SHAPE, dtype=np.uint8)
+    Ry, RxT = area_matrix(FRAME_SHAPE[0], SIZE[0]), area_matrix(FRAME_SHAPE[1], SIZE[1]).T
+    print("Frames/sec, batch of {} (210, 160, 3) frames -> {} stacks of 4 x {}".format(n_envs, n_envs, SIZE))
+    t_start = timer()
+    for _ in range(n_itr):
+        ref = np.stack([preprocess_one(f, g, Ry, RxT) for f, g in zip(frames, last_frames)])
+    print("{:<20}{:>10.0f}".format("per-image loop" + (" (cv2)" if cv2 else ""),
+                                   n_itr * n_envs / (timer() - t_start)))
+    print("{:<20}".format("threads:") + "".join(["{:>10}".format(n) for n in thread_counts]))
+    for backend in BACKENDS:
+        if backend == 'cv2' and cv2 is None:
+            print("{:<20}{:>10}".format("batch cv2", "(no cv2)"))
+            continue
+        rates = []
+        for n_threads in thread_counts:
+            prep = FramePreprocessor(n_envs, n_threads=n_threads, backend=backend)
+            prep.reset(frames)
+            t_start = timer()
+            for _ in range(n_itr):
+                prep.step(frames, last_frames)
+            rates.append(n_itr * n_envs / (timer() - t_start))
+            assert np.abs(prep.frames.astype(int) - ref).max() <= 1
+            prep.close()
+        print("{:<20}".format("batch " + backend) + "".join(["{:>10.0f}".format(r) for r in rates]))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_envs', type=int, default=64)
+    parser.add_argument('-t', '--n_threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('-i', '--n_itr', type=int, default=20)
+    args = parser.parse_args()
+    main(args.n_envs, args.n_threads, args.n_itr)
@@ -0,0 +1,35 @@
+
+"""
+Baseline functions acting on global variables (exposed to user).
+"""
+
+import data_glob as g
+import baseline_loc
+
+
+__all__ = ['save_baseline', 'compare_baseline', 'print_compare_baseline']
+
+
+def save_baseline(config='default', directory=None):
+    """ Store the current times, keyed by this machine and config name. """
+    filename = baseline_loc.baseline_file(config, directory)
+    return baseline_loc.save(g.rf, filename, config)
+
+
+def compare_baseline(config='default', directory=None, alpha=baseline_loc.ALPHA,
+                     min_ratio=baseline_loc.MIN_RATIO):
+    """ Compare the current times against the stored baseline for this
+    machine and config.  Returns (report, list of significantly slower stamps).
+    """
+    base_data = baseline_loc.load(baseline_loc.baseline_file(config, directory))
+    new_stamps = baseline_loc.flatten(g.rf)
+    results = baseline_loc.compare(base_data['stamps'], new_stamps, alpha, min_ratio)
+    rep = baseline_loc.write_comparison(results, base_data)
+    slower = [r[0] for r in results if r[-1] == baseline_loc.SLOWER]
+    return rep, slower
+
+
+def print_compare_baseline(*args, **kwargs):
+    rep, slower = compare_baseline(*args, **kwargs)
+    print rep
+    return slower
@@ -0,0 +1,173 @@
+
+"""
+Baseline storage and regression comparison of Times trees, acting on locally
+provided variables (hidden from user, except through baseline_glob, and
+usable as a command: python baseline_loc.py BASELINE_FILE NEW_FILE).
+
+Stamps are aligned by name hierarchy: each is keyed by the path of
+timer (position) links down to it, e.g. 'root(loop1)/loop1/l1_first'.
+Per-iteration distributions are compared with a one-sided Mann-Whitney U
+test (normal approximation, tie-corrected), flagging significant slowdowns.
+"""
+
+import os
+import json
+import time
+import math
+import socket
+import platform
+import numpy as np
+from report_loc import _get_lineage
+
+
+BASELINE_ENV = 'GTIMER_BASELINE_DIR'
+BASELINE_DIR = os.path.join('~', '.gtimer_baselines')
+ALPHA = 0.01
+MIN_RATIO = 1.05  # (don't flag slowdowns smaller than this, however significant)
+SLOWER = 'SLOWER'
+SLOWER_UNTESTED = 'slower?'
+
+# A few report formats.
+PATH_WIDTH = 40
+FMT_HDR = "\n{{:<{0}}}{{:>12}}{{:>12}}{{:>8}}{{:>10}}  {{}}".format(PATH_WIDTH)
+FMT_ROW = "\n{{:<{0}}}{{:>12.4g}}{{:>12.4g}}{{:>8.3f}}{{:>10}}  {{}}".format(PATH_WIDTH)
+
+
+#
+# Functions to expose elsewhere in package.
+#
+
+
+def flatten(times, flat=None):
+    """ Dict of stamp path -> {'cum': float, 'itrs': list} for the whole tree. """
+    if flat is None:
+        flat = dict()
+    prefix = ''.join(["{}({})/".format(*link) for link in _get_lineage(times)]) + times.name + '/'
+    stamps = times.stamps
+    for s in stamps.order:
+        flat[prefix + s] = {'cum': stamps.cum[s], 'itrs': list(stamps.itrs.get(s, []))}
+    for _, children in times.children.iteritems():
+        for child in children:
+            flatten(child, flat)
+    return flat
+
+
+def baseline_file(config, directory=None, machine=None):
+    if directory is None:
+        directory = os.environ.get(BASELINE_ENV, BASELINE_DIR)
+    if machine is None:
+        machine = socket.gethostname()
+    return os.path.join(os.path.expanduser(directory), str(machine), "{}.json".format(config))
+
+
+def save(times, filename, config=None):
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    data = {'machine': socket.gethostname(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'config': config,
+            'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'total': times.total,
+            'stamps': flatten(times),
+            }
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    return filename
+
+
+def load(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def compare(base_stamps, new_stamps, alpha=ALPHA, min_ratio=MIN_RATIO):
+    """ Returns list of (path, base median, new median, ratio, p-value, flag)
+    for stamps present in both; p-value is None without iterations to test.
+    """
+    results = []
+    for path in sorted(set(base_stamps) & set(new_stamps)):
+        base = _samples(base_stamps[path])
+        new = _samples(new_stamps[path])
+        base_med = np.median(base)
+        new_med = np.median(new)
+        ratio = new_med / base_med if base_med > 0 else float('inf')
+        p = mann_whitney_greater(new, base) if min(len(base), len(new)) > 1 else None
+        flag = ''
+        if ratio >= min_ratio:
+            if p is None:
+                flag = SLOWER_UNTESTED  # (single values, no test possible)
+            elif p < alpha:
+                flag = SLOWER
+        results.append((path, base_med, new_med, ratio, p, flag))
+    return results
+
+
+def write_comparison(results, base_data=None, new_data=None):
+    rep = "\n---Begin Baseline Comparison---"
+    for label, data in [('Baseline:', base_data), ('New:', new_data)]:
+        if data is not None:
+            rep += "\n{:<10}{} {} {}".format(label, data['machine'], data['config'], data['date'])
+    rep += FMT_HDR.format('Stamp', 'Base (med)', 'New (med)', 'Ratio', 'p', '')
+    for path, base_med, new_med, ratio, p, flag in results:
+        p_str = '-' if p is None else "{:.2g}".format(p)
+        rep += FMT_ROW.format(_fit_path(path), base_med, new_med, ratio, p_str, flag)
+    n_slower = sum([1 for r in results if r[-1] == SLOWER])
+    rep += "\n\n{} of {} stamps significantly slower.".format(n_slower, len(results))
+    rep += "\n---End Baseline Comparison---\n"
+    return rep
+
+
+def mann_whitney_greater(x, y):
+    """ One-sided p-value that x tends to be larger than y. """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n1, n2 = len(x), len(y)
+    n = n1 + n2
+    both = np.sort(np.concatenate([x, y]))
+    left = np.searchsorted(both, x, side='left')
+    right = np.searchsorted(both, x, side='right')
+    u = np.sum((left + right + 1) / 2.) - n1 * (n1 + 1) / 2.  # (average ranks for ties)
+    _, counts = np.unique(both, return_counts=True)
+    tie = np.sum(counts ** 3 - counts) / float(n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12. * ((n + 1) - tie))
+    if sigma == 0:
+        return 1.
+    z = (u - n1 * n2 / 2. - 0.5) / sigma  # (with continuity correction)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+#
+# Private helper functions.
+#
+
+
+def _samples(stamp):
+    return np.asarray(stamp['itrs'] if stamp['itrs'] else [stamp['cum']], dtype=float)
+
+
+def _fit_path(path):
+    if len(path) > PATH_WIDTH:
+        return '..' + path[-(PATH_WIDTH - 2):]
+    return path
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Compare two saved gtimer baselines.")
+    parser.add_argument('baseline', help="baseline file (.json)")
+    parser.add_argument('new', help="new results file (.json)")
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--min_ratio', type=float, default=MIN_RATIO)
+    args = parser.parse_args()
+    base_data = load(args.baseline)
+    new_data = load(args.new)
+    results = compare(base_data['stamps'], new_data['stamps'], args.alpha, args.min_ratio)
+    print write_comparison(results, base_data, new_data)
+    return 1 if any([r[-1] == SLOWER for r in results]) else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
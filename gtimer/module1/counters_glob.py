@@ -0,0 +1,49 @@
+
+"""
+Counter sampling functions acting on global variables (some exposed to user).
+"""
+
+import data_glob as g
+import counters_loc
+
+
+__all__ = ['enable_counters', 'disable_counters']
+
+
+#
+# Functions to expose to user.
+#
+
+
+def enable_counters(perf=True):
+    """ From now on, every stamp also records the change in process CPU time,
+    context switches, page faults and (if perf, where available) hardware
+    counters since the last stamp.  Returns list of counters available.
+    """
+    if g.cs is not None:
+        g.cs.close()
+    g.cs = counters_loc.CounterSampler(perf)
+    g.tf.last_c = g.cs.read()
+    names = counters_loc.COUNTER_NAMES
+    return names if g.cs.fds else names[:counters_loc.N_RUSAGE]
+
+
+def disable_counters():
+    if g.cs is not None:
+        g.cs.close()
+        g.cs = None
+
+
+#
+# Functions to expose elsewhere in the package.
+#
+
+
+def stamp_counters(name):
+    c = g.cs.read()
+    if g.tf.last_c is not None:
+        if name in g.sf.counters:
+            g.sf.counters[name] += c - g.tf.last_c
+        else:
+            g.sf.counters[name] = c - g.tf.last_c
+    g.tf.last_c = c
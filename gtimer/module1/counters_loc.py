@@ -0,0 +1,99 @@
+
+"""
+Resource and hardware counter sampling (hidden from user, except through
+counters_glob).
+
+Every sample has the same layout (COUNTER_NAMES): process resource usage
+from getrusage, then perf_event hardware counters for the calling thread.
+Hardware counters read NaN where perf_event_open is unavailable (not
+Linux, or not permitted, see /proc/sys/kernel/perf_event_paranoid).
+"""
+
+import os
+import ctypes
+import struct
+import resource
+import platform
+import numpy as np
+
+
+COUNTER_NAMES = ['cpu', 'vcsw', 'ivcsw', 'minflt', 'majflt', 'cycles', 'instr', 'llc_miss']
+N_RUSAGE = 5
+
+# Report formats per counter.
+COUNTER_FMTS = {'cpu': "{:.4g}", 'cycles': "{:.3g}", 'instr': "{:.3g}", 'llc_miss': "{:.3g}"}
+COUNTER_FMT_DEFAULT = "{:.0f}"
+
+# perf_event_open (see linux/perf_event.h).
+PERF_TYPE_HARDWARE = 0
+PERF_COUNT_HW = [0, 1, 3]  # (cpu cycles, instructions, cache (LLC) misses)
+PERF_FLAG_EXCLUDE_KERNEL = 1 << 5
+PERF_FLAG_EXCLUDE_HV = 1 << 6
+PERF_SYSCALL_NR = {'x86_64': 298, 'aarch64': 241, 'ppc64le': 319}
+
+
+class PerfEventAttr(ctypes.Structure):
+    """ First 64 bytes (PERF_ATTR_SIZE_VER0) of struct perf_event_attr. """
+    _fields_ = [('type', ctypes.c_uint32),
+                ('size', ctypes.c_uint32),
+                ('config', ctypes.c_uint64),
+                ('sample_period', ctypes.c_uint64),
+                ('sample_type', ctypes.c_uint64),
+                ('read_format', ctypes.c_uint64),
+                ('flags', ctypes.c_uint64),
+                ('wakeup_events', ctypes.c_uint32),
+                ('bp_type', ctypes.c_uint32),
+                ('config1', ctypes.c_uint64),
+                ]
+
+
+class CounterSampler(object):
+    """ Reads all counters into one array; opens perf events once. """
+
+    def __init__(self, perf=True):
+        self.fds = open_perf_events() if perf else []
+        self.n_perf = len(PERF_COUNT_HW)
+
+    def read(self):
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        vals = [ru.ru_utime + ru.ru_stime, ru.ru_nvcsw, ru.ru_nivcsw, ru.ru_minflt, ru.ru_majflt]
+        if self.fds:
+            vals += [struct.unpack('Q', os.read(fd, 8))[0] for fd in self.fds]
+        else:
+            vals += [np.nan] * self.n_perf
+        return np.array(vals, dtype=np.float64)
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+
+def open_perf_events():
+    """ Returns list of file descriptors (one per PERF_COUNT_HW), or empty list. """
+    nr = PERF_SYSCALL_NR.get(platform.machine())
+    if nr is None:
+        return []
+    try:
+        syscall = ctypes.CDLL(None, use_errno=True).syscall
+    except (OSError, AttributeError):
+        return []
+    fds = []
+    for config in PERF_COUNT_HW:
+        attr = PerfEventAttr(type=PERF_TYPE_HARDWARE,
+                             size=ctypes.sizeof(PerfEventAttr),
+                             config=config,
+                             flags=PERF_FLAG_EXCLUDE_KERNEL | PERF_FLAG_EXCLUDE_HV)
+        fd = syscall(nr, ctypes.byref(attr), 0, -1, -1, 0)  # (this thread, any cpu)
+        if fd < 0:
+            for f in fds:
+                os.close(f)
+            return []
+        fds.append(fd)
+    return fds
+
+
+def fmt_counters(vals):
+    """ Short string of all available (non-NaN) counter values. """
+    return ' '.join(["{} {}".format(n, COUNTER_FMTS.get(n, COUNTER_FMT_DEFAULT).format(v))
+                     for n, v in zip(COUNTER_NAMES, vals) if not np.isnan(v)])
@@ -4,6 +4,7 @@ All global data and timer state information resides here.
 (Hidden from user.)
 """
 
+import os
 from focusedstack import FocusedStack
 from timer_classes import Timer
 from loop import Loop
@@ -13,6 +14,14 @@ from loop import Loop
 # Constants.
 #
 UNASGN = 'UNASSIGNED'
+DISABLE_ENV = 'GTIMER_DISABLE'
+
+
+#
+# Global switch (read when decorators are applied, so set it before importing
+# the code to be timed, e.g. via environment variable).
+#
+disabled = os.environ.get(DISABLE_ENV, '0').lower() not in ('', '0', 'false', 'no')
 
 
 #
@@ -29,6 +38,8 @@ tf = None  # timer_stack.focus: 'Timer in Focus'
 rf = None  # timer_stack.focus.times: 'Times (Record) in Focus'
 sf = None  # timer_stack.focus.times.stamps: 'Stamps in Focus'
 lf = None  # loop_stack.focus: 'Loop in Focus'
+tr = None  # trace_loc.TraceRecorder: 'Trace Recorder' (when tracing)
+cs = None  # counters_loc.CounterSampler: 'Counter Sampler' (when sampling)
 
 
 # TO DO: Automate the making of these shortcuts.
@@ -51,6 +62,8 @@ def create_next_timer(name, *args, **kwargs):
     tf = timer_stack.create_next(name, *args, **kwargs)
     rf = tf.times
     sf = rf.stamps
+    if cs is not None:
+        tf.last_c = cs.read()
 
 
 def remove_last_timer():
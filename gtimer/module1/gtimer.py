@@ -8,6 +8,9 @@ from timer_glob import *
 from loop import *
 from timer_mgmt import *
 from report_glob import *
+from trace_glob import *
+from baseline_glob import *
+from counters_glob import *
 
 
 
@@ -7,6 +7,7 @@ from timeit import default_timer as timer
 import data_glob as g
 import times_glob
 import timer_mgmt
+import counters_glob
 
 
 __all__ = ['timed_for', 'timed_loop']
@@ -161,6 +162,10 @@ def loop_end():
         elapsed = t - g.tf.last_t
         g.sf.cum[g.lf.name] += elapsed
         g.sf.itrs[g.lf.name].append(elapsed)
+        if g.tr is not None:
+            g.tr.record(g.tf.name, g.lf.name, g.tf.last_t, t)
+        if g.cs is not None:
+            counters_glob.stamp_counters(g.lf.name)
         g.tf.last_t = t
         g.focus_forward_timer()
     g.rf.self_cut += timer() - t
@@ -22,6 +22,14 @@ def print_report():
     return rep
 
 
+def save_itrs(filename):
+    report_loc.save_itrs(g.rf, filename)
+
+
+def write_itrs_csv(filename):
+    report_loc.write_itrs_csv(g.rf, filename)
+
+
 def write_structure():
     return report_loc.write_structure(g.rf)
 
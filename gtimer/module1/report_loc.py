@@ -3,7 +3,11 @@
 Reporting functions acting on locally provided variables (hidden from user).
 """
 
+import warnings
+from collections import OrderedDict
+import numpy as np
 from data_glob import UNASGN
+from counters_loc import fmt_counters
 
 
 # A few header formats.
@@ -27,6 +31,8 @@ ITR_SPC = ' ' * (TAB_WIDTH + NAME_WIDTH - ITR_WIDTH)
 
 # Later, make it so the user can set width, prec with a function call?
 
+SUMM_NAMES = ['Sum', 'Mean', 'Std', 'Min', 'Max']
+
 DELIM = '\t'
 D_HDR = "{{}}{}{{}}\n".format(DELIM)
 IDT_SYM = '+'
@@ -46,7 +52,7 @@ def delim_report(times, include_itrs=True):
     rep += _delim_stamps(times)
     if include_itrs:
         rep_itrs = ''
-        rep_itrs += _report_itrs(times)
+        rep_itrs += _delim_itrs(times)
         if rep_itrs:
             rep += "\n\nLoop Iterations\n"
             rep += rep_itrs
@@ -79,6 +85,28 @@ def print_report(include_itrs=True):
     return rep
 
 
+def save_itrs(times, filename):
+    """ All loop iterations in the tree to one .npz file: for each timer (keyed
+    by lineage path), the itrs array and its stamp names under key + ':stamps'.
+    """
+    arrays = dict()
+    for key, (itrs_order, itrs) in _itrs_arrays(times).iteritems():
+        arrays[key] = itrs
+        arrays[key + ':stamps'] = np.array(itrs_order, dtype=str)
+    np.savez(filename, **arrays)
+
+
+def write_itrs_csv(times, filename):
+    """ All loop iterations in the tree to one CSV file, one block per timer. """
+    blocks = []
+    for key, (itrs_order, itrs) in _itrs_arrays(times).iteritems():
+        block = "# {}\nIter.{}".format(key, ''.join([',' + s for s in itrs_order]))
+        block += _fmt_rows(["\n{}".format(i) for i in xrange(itrs.shape[0])], itrs, "%r", '', ',')
+        blocks.append(block)
+    with open(filename, 'w') as f:
+        f.write('\n\n'.join(blocks) + '\n')
+
+
 def write_structure(times):
     strct = '\n---Times Data Tree---\n'
     strct += _write_structure(times)
@@ -113,6 +141,8 @@ def _report_stamps(times, indent=0):
     stamps = times.stamps
     for stamp in stamps.order:
         rep_stmps += fmt.format("{} ".format(stamp), stamps.cum[stamp])
+        if stamp in stamps.counters:
+            rep_stmps += "  ({})".format(fmt_counters(stamps.counters[stamp]))
         if stamp in times.children:
             for child in times.children[stamp]:
                 rep_stmps += _report_stamps(child, indent=indent + 2)
@@ -128,13 +158,14 @@ def _delim_stamps(times, indent=0):
     rep_stmps = ''
     for stamp in stamps.order:
         rep_stmps += "{}{}{}{}\n".format(IDT_SYM * indent, stamp, DELIM, stamps.cum[stamp])
-        for stamp in times.children:
+        if stamp in times.children:
             for child in times.children[stamp]:
                 rep_stmps += _delim_stamps(child, indent=indent + 1)
     if UNASGN in times.children:
-        rep_stmps += "\n{}{}".format(IDT_SYM * indent, UNASGN)
+        rep_stmps += "{}{}\n".format(IDT_SYM * indent, UNASGN)
         for child in times.children[UNASGN]:
             rep_stmps += _delim_stamps(child, indent=indent + 1)
+    return rep_stmps
 
 
 def _report_itrs(times):
@@ -145,34 +176,17 @@ def _report_itrs(times):
         if times.parent is not None:
             lin_str = _fmt_lineage(_get_lineage(times))
             rep_itrs += FMT_GEN_SHRT.format('Lineage:', lin_str)
-        rep_itrs += "\n\nIter."
-        itrs_order = []
-        is_key_active = []
-        for stamp in stamps.order:
-            if stamp in stamps.itrs:
-                itrs_order += [stamp]
-                is_key_active += [True]  # (List needed for any() usage.)
-        for stamp in itrs_order:
-            rep_itrs += "{0}{{:>{1}.{1}}}".format(TAB, NAME_WIDTH).format(stamp)
-        rep_itrs += "\n-----"
-        for stamp in itrs_order:
-            rep_itrs += "{}{{:>{}}}".format(TAB, NAME_WIDTH).format('------')
-        itr = 0
-        while any(is_key_active):  # (Must be a list)
-            next_line = '\n{:<5,}'.format(itr)
-            for i, stamp in enumerate(itrs_order):
-                if is_key_active[i]:
-                    try:
-                        val = stamps.itrs[stamp][itr]
-                        next_line += "{}{{:{}.2f}}".format(ITR_SPC, ITR_WIDTH).format(val)
-                    except IndexError:
-                        next_line += "{}{}".format(TAB, ' ' * NAME_WIDTH)
-                        is_key_active[i] = False
-                else:
-                    next_line += "{}{}".format(TAB, ' ' * NAME_WIDTH)
-            if any(is_key_active):
-                rep_itrs += next_line
-            itr += 1
+        itrs_order, itrs = _itrs_array(times)
+        name_fmt = "{}{{:>{}.{}}}".format(TAB, NAME_WIDTH, NAME_WIDTH)
+        rep_itrs += "\n\nIter." + ''.join([name_fmt.format(s) for s in itrs_order])
+        rep_itrs += "\n-----" + "{}{:>{}}".format(TAB, '------', NAME_WIDTH) * len(itrs_order)
+        val_fmt = "%{}.2f".format(ITR_WIDTH)
+        blank = ' ' * ITR_WIDTH
+        lbls = ['\n{:<5,}'.format(i) for i in xrange(itrs.shape[0])]
+        rep_itrs += _fmt_rows(lbls, itrs, val_fmt, blank, ITR_SPC)
+        rep_itrs += "\n-----" + "{}{:>{}}".format(TAB, '------', NAME_WIDTH) * len(itrs_order)
+        rep_itrs += _fmt_rows(['\n{:<5}'.format(s) for s in SUMM_NAMES], _itrs_summary(itrs),
+                              val_fmt, blank, ITR_SPC)
         rep_itrs += "\n"
     for _, children in times.children.iteritems():
         for child in children:
@@ -187,31 +201,10 @@ def _delim_itrs(times):
         rep_itrs += "Timer{}{}\n".format(DELIM, times.name)
         lin_str = _fmt_lineage(_get_lineage(times))
         rep_itrs += "Lineage{}{}\n".format(DELIM, lin_str)
-        rep_itrs += "\n\nIter."
-        itrs_order = []
-        is_key_active = []
-        for stamp in stamps.order:
-            if stamp in stamps.itrs:
-                itrs_order += [stamp]
-                is_key_active += [True]
-        for stamp in itrs_order:
-            rep_itrs += "{}{}".format(DELIM, stamp)
-        itr = 0
-        while any(is_key_active):
-            next_line = "\n{}".format(itr)
-            for i, stamp in enumerate(itrs_order):
-                if is_key_active[i]:
-                    try:
-                        val = stamp.itrs[stamp][itr]
-                        next_line += "{}{}".format(DELIM, val)
-                    except IndexError:
-                        next_line += "{}".format(DELIM)
-                        is_key_active[i] = False
-                else:
-                    next_line += "{}".format(DELIM)
-            if any(is_key_active):
-                rep_itrs += next_line
-            itr += 1
+        itrs_order, itrs = _itrs_array(times)
+        rep_itrs += "\n\nIter." + ''.join([DELIM + s for s in itrs_order])
+        rep_itrs += _fmt_rows(["\n{}".format(i) for i in xrange(itrs.shape[0])], itrs, "%r", '', DELIM)
+        rep_itrs += _fmt_rows(["\n{}".format(s) for s in SUMM_NAMES], _itrs_summary(itrs), "%r", '', DELIM)
         rep_itrs += "\n"
     for _, children in times.children.iteritems():
         for child in children:
@@ -219,6 +212,61 @@ def _delim_itrs(times):
     return rep_itrs
 
 
+def _itrs_array(times):
+    """ Iterations of all loop stamps in one (itrs x stamps) array, padded with
+    NaN where a stamp has fewer iterations than the longest. """
+    stamps = times.stamps
+    itrs_order = [s for s in stamps.order if s in stamps.itrs]
+    lengths = [len(stamps.itrs[s]) for s in itrs_order]
+    itrs = np.full((max(lengths + [0]), len(itrs_order)), np.nan)
+    for j, (s, n) in enumerate(zip(itrs_order, lengths)):
+        itrs[:n, j] = stamps.itrs[s]
+    return itrs_order, itrs
+
+
+def _itrs_summary(itrs):
+    """ Summary rows (see SUMM_NAMES) computed down each stamp's column. """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # (all-NaN columns)
+        return np.vstack([np.nansum(itrs, axis=0),
+                          np.nanmean(itrs, axis=0),
+                          np.nanstd(itrs, axis=0),
+                          np.nanmin(itrs, axis=0),
+                          np.nanmax(itrs, axis=0),
+                          ])
+
+
+def _fmt_rows(lbls, vals, val_fmt, blank, sep):
+    """ Each label followed by its row of a 2-D array, sep before every
+    value, NaN entries blank: one %-format per row, one join (np.char
+    operations loop in Python per element). """
+    cell = sep.replace('%', '%%') + val_fmt
+    empty = (sep + blank).replace('%', '%%')
+    row_fmt = cell * vals.shape[1]
+    has_nan = np.isnan(vals).any(axis=1).tolist()
+    lines = []
+    for lbl, row, nan in zip(lbls, vals.tolist(), has_nan):
+        if nan:  # (only the last rows of a loop with uneven stamps)
+            lines.append(lbl + ''.join([empty if v != v else cell for v in row]) %
+                         tuple([v for v in row if v == v]))
+        else:
+            lines.append(lbl + row_fmt % tuple(row))
+    return ''.join(lines)
+
+
+def _itrs_arrays(times, arrays=None):
+    """ Flatten the tree: key (lineage path) -> (stamp names, itrs array). """
+    if arrays is None:
+        arrays = OrderedDict()
+    if times.stamps.itrs:
+        key = ''.join(["{}({})/".format(*link) for link in _get_lineage(times)]) + times.name
+        arrays[key] = _itrs_array(times)
+    for _, children in times.children.iteritems():
+        for child in children:
+            _itrs_arrays(child, arrays)
+    return arrays
+
+
 def _get_lineage(times):
     if times.parent is not None:
         return _get_lineage(times.parent) + ((times.parent.name, times.pos_in_parent), )
@@ -22,6 +22,7 @@ class Timer(object):
         self.rgstr_stamps = rgstr_stamps
         self.start_t = timer()
         self.last_t = self.start_t
+        self.last_c = None  # counters sample (if sampling)
 
 
 class Times(object):
@@ -46,6 +47,7 @@ class Stamps(object):
         self.cum = dict()
         self.itrs = dict()
         self.order = list()
+        self.counters = dict()  # key: stamp, value: array of counter deltas
         self.sum_t = 0.
 
 
@@ -6,6 +6,7 @@ Timer() functions acting on global variables (many exposed to user).
 from timeit import default_timer as timer
 import data_glob as g
 import times_glob
+import counters_glob
 
 #
 # Functions to expose to user.
@@ -24,6 +25,8 @@ def start():
     g.rf.total = 0.  # (In case previously paused.)
     g.tf.start_t = t
     g.tf.last_t = t
+    if g.cs is not None:
+        g.tf.last_c = g.cs.read()
     return t
 
 
@@ -50,6 +53,10 @@ def stamp(name, unique=True):
             g.sf.cum[name] += elapsed
     if g.tf.children_awaiting:
         times_glob.l_assign_children(name)
+    if g.tr is not None:
+        g.tr.record(g.tf.name, name, g.tf.last_t, t)
+    if g.cs is not None:
+        counters_glob.stamp_counters(name)
     g.tf.last_t = t
     g.rf.self_cut += timer() - t
     g.rf.self_agg += g.rf.self_cut
@@ -72,6 +79,10 @@ def l_stamp(name, unique=True):
         _nonunique_loop_stamp(name, elapsed)
     if g.tf.children_awaiting:
         times_glob.l_assign_children(name)
+    if g.tr is not None:
+        g.tr.record(g.tf.name, name, g.tf.last_t, t)
+    if g.cs is not None:
+        counters_glob.stamp_counters(name)
     g.tf.last_t = t
     g.rf.self_cut += timer() - t
     return t
@@ -124,6 +135,8 @@ def resume():
     g.tf.paused = False
     g.tf.start_t = t
     g.tf.last_t = t
+    if g.cs is not None:
+        g.tf.last_c = g.cs.read()
     return t
 
 
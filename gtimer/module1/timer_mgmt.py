@@ -4,11 +4,13 @@ Functions for creating new timers, closing old ones, and handling the
 relationships of the timers. (Mostly exposed to user.)
 """
 
+from functools import wraps
 import data_glob as g
 import timer_glob
 
 
-__all__ = ['open_next_timer', 'close_last_timer', 'wrap', 'rename_root_timer']
+__all__ = ['open_next_timer', 'close_last_timer', 'wrap', 'rename_root_timer',
+           'timed', 'block', 'disable', 'enable']
 
 
 #
@@ -54,6 +56,79 @@ def wrap(func, rgstr_stamps=list()):
     return timer_wrapped
 
 
+def timed(func=None, name=None, rgstr_stamps=list()):
+    """ Decorator: each call of func is timed in its own timer (named after
+    func by default), nested under whichever timer is open at call time.
+    Resolved when applied: if disabled, func is returned unwrapped.
+    Use as @timed, @timed('name') or @timed(name='...', rgstr_stamps=[...]).
+    """
+    if isinstance(func, basestring):  # (@timed('name'))
+        if name is not None:
+            raise TypeError("timed() got the name twice: {!r} and {!r}".format(func, name))
+        func, name = None, func
+    if func is None:
+        return lambda f: timed(f, name, rgstr_stamps)
+    if not callable(func):
+        raise TypeError("timed() decorates a function (or takes a timer name), got: {!r}".format(func))
+    if g.disabled:
+        return func
+    name = func.__name__ if name is None else str(name)
+    rgstr_stamps = sanitize_rgstr_stamps(rgstr_stamps)
+
+    @wraps(func)
+    def timer_wrapped(*args, **kwargs):
+        open_next_timer(name, rgstr_stamps)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_last_timer()  # (also if func raises, as block() does)
+    return timer_wrapped
+
+
+class _Block(object):
+
+    def __init__(self, name, rgstr_stamps):
+        self.name = name
+        self.rgstr_stamps = rgstr_stamps
+
+    def __enter__(self):
+        open_next_timer(self.name, self.rgstr_stamps)
+        return self
+
+    def __exit__(self, *args):
+        close_last_timer()
+
+
+class _EmptyBlock(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_EMPTY_BLOCK = _EmptyBlock()
+
+
+def block(name, rgstr_stamps=list()):
+    """ Context manager: time the enclosed code in its own (nested) timer.
+    If disabled, returns a shared do-nothing context manager.
+    """
+    if g.disabled:
+        return _EMPTY_BLOCK
+    return _Block(str(name), sanitize_rgstr_stamps(rgstr_stamps))
+
+
+def disable():
+    """ Affects timed() / block() applied from now on. """
+    g.disabled = True
+
+
+def enable():
+    g.disabled = False
+
+
 def rename_root_timer(name):
     name = str(name)
     g.focus_root_timer()
@@ -40,6 +40,7 @@ def _merge_stamps(rcvr, new):
             rcvr.order.append(s)
     _merge_dict(rcvr, new, 'cum')
     _merge_dict(rcvr, new, 'itrs')
+    _merge_dict(rcvr, new, 'counters')
     rcvr.sum_t += new.sum_t
 
 
@@ -0,0 +1,43 @@
+
+"""
+Event recording (tracing) functions acting on global variables (exposed to user).
+"""
+
+import os
+import data_glob as g
+import trace_loc
+
+
+__all__ = ['start_trace', 'flush_trace', 'stop_trace', 'chrome_trace']
+
+
+def start_trace(filename=None, buf_size=trace_loc.BUF_SIZE):
+    """ Record every stamp interval from now on. One file per process
+    (default name includes the pid) so all processes can be combined later.
+    """
+    if g.tr is not None:
+        raise RuntimeError("Trace already started (stop it first).")
+    if filename is None:
+        filename = "gtimer_trace_{}.bin".format(os.getpid())
+    g.tr = trace_loc.TraceRecorder(filename, buf_size)
+    return g.tr.filename
+
+
+def flush_trace():
+    if g.tr is None:
+        raise RuntimeError("No trace started.")
+    g.tr.flush()
+
+
+def stop_trace():
+    if g.tr is None:
+        raise RuntimeError("No trace started.")
+    g.tr.flush()
+    filename = g.tr.filename
+    g.tr = None
+    return filename
+
+
+def chrome_trace(filenames, out_file='gtimer_trace.json', merge=None):
+    """ Convert trace file(s) to Chrome trace JSON (chrome://tracing, Perfetto). """
+    return trace_loc.write_chrome_trace(filenames, out_file, merge)
@@ -0,0 +1,108 @@
+
+"""
+Event recording into a binary buffer, and conversion to Chrome trace JSON
+(hidden from user, except through trace_glob).
+
+Each event is one fixed-size record: (stamp ID, pid, thread ID, start, end).
+Records accumulate in a preallocated array and are written to disk in bulk
+only when the buffer fills (or on flush).  Stamp IDs index into a names list
+of (timer name, stamp name) pairs, kept in a small JSON file alongside.
+"""
+
+import os
+import json
+import numpy as np
+try:
+    from thread import get_ident
+except ImportError:  # (python 3)
+    from threading import get_ident
+
+
+EVENT_DTYPE = np.dtype([('id', '<u4'),
+                        ('pid', '<u4'),
+                        ('tid', '<u8'),
+                        ('start', '<f8'),
+                        ('end', '<f8'),
+                        ])
+NAMES_EXT = '.names.json'
+BUF_SIZE = 100000  # events (32 bytes each)
+
+
+class TraceRecorder(object):
+    """ Preallocated event buffer, flushed to file in bulk. """
+
+    def __init__(self, filename, buf_size=BUF_SIZE):
+        self.filename = str(filename)
+        self.buf = np.empty(int(buf_size), dtype=EVENT_DTYPE)
+        self.size = len(self.buf)
+        self.n = 0
+        self.ids = dict()  # key: (timer name, stamp name), value: stamp ID
+        self.names = list()
+        self.pid = os.getpid()
+        open(self.filename, 'wb').close()  # (truncate any old trace)
+
+    def record(self, timer_name, stamp_name, start, end):
+        key = (timer_name, stamp_name)
+        try:
+            stamp_id = self.ids[key]
+        except KeyError:
+            stamp_id = self.ids[key] = len(self.names)
+            self.names.append(key)
+        self.buf[self.n] = (stamp_id, self.pid, get_ident(), start, end)
+        self.n += 1
+        if self.n == self.size:
+            self.flush()
+
+    def flush(self):
+        if self.n > 0:
+            with open(self.filename, 'ab') as f:
+                self.buf[:self.n].tofile(f)
+            self.n = 0
+        with open(self.filename + NAMES_EXT, 'w') as f:
+            json.dump(self.names, f)
+
+
+def load_trace(filename):
+    """ Returns (events array, names list) of one trace file. """
+    events = np.fromfile(filename, dtype=EVENT_DTYPE)
+    with open(filename + NAMES_EXT, 'r') as f:
+        names = [tuple(n) for n in json.load(f)]
+    return events, names
+
+
+def chrome_events(filename):
+    events, names = load_trace(filename)
+    ts = events['start'] * 1e6  # (Chrome trace uses microseconds)
+    dur = (events['end'] - events['start']) * 1e6
+    ids = events['id'].tolist()
+    pids = events['pid'].tolist()
+    tids = events['tid'].tolist()
+    return [{"name": names[i][1],
+             "cat": names[i][0],
+             "ph": "X",
+             "ts": t,
+             "dur": d,
+             "pid": p,
+             "tid": h}
+            for i, t, d, p, h in zip(ids, ts.tolist(), dur.tolist(), pids, tids)]
+
+
+def write_chrome_trace(filenames, out_file, merge=None):
+    """ Combine trace files (e.g. one per process) into one Chrome trace JSON,
+    optionally appending the events of an existing trace (e.g. a framework
+    timeline) given by path in merge.
+    """
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    trace_events = []
+    for filename in filenames:
+        trace_events += chrome_events(filename)
+    if merge is not None:
+        with open(merge, 'r') as f:
+            other = json.load(f)
+        if isinstance(other, dict):
+            other = other.get("traceEvents", [])
+        trace_events += other
+    with open(out_file, 'w') as f:
+        json.dump({"traceEvents": trace_events}, f)
+    return len(trace_events)
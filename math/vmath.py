@@ -0,0 +1,177 @@
+
+"""
+Elementwise transcendental math (tanh, exp, log, sigmoid) over large NumPy
+arrays, in cache-sized chunks and across a thread pool, always into out=
+arrays (no temporaries).  np_tanh.py times one plain np.tanh call;
+math_speed.c and math_vml.c compare libm, AMD libm, SVML and MKL VML.
+
+Backends:
+    'numpy'    one ufunc call on the whole array (multi-pass functions
+               like sigmoid stream the whole array through memory each pass)
+    'chunked'  the same ufuncs per cache-sized chunk (all passes run while
+               the chunk is in cache)
+    'threads'  chunked, each thread on its own contiguous part (ufuncs
+               release the GIL)
+    'numexpr'  numexpr.evaluate (own threads; uses VML if numexpr was built
+               with MKL), if installed
+The default backend for each function is picked by a one-time calibration
+benchmark (calibrate(), run on first use); arrays smaller than MIN_PARALLEL
+elements, or not contiguous, always take one ufunc call.
+
+Usage:
+    import vmath
+    vmath.tanh(x, out=y)
+    h = vmath.sigmoid(x)                    # (new array)
+    vmath.calibrate(verbose=True)           # (optional: re-run, print times)
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+CHUNK_BYTES = 2 ** 17  # (per chunk and input: input + output fit in L2)
+MIN_PARALLEL = 2 ** 16  # (elements)
+BACKENDS = ['numpy', 'chunked', 'threads'] + (['numexpr'] if numexpr is not None else [])
+
+
+def _sigmoid(x, out):
+    np.negative(x, out=out)
+    np.exp(out, out=out)
+    np.add(out, 1, out=out)
+    np.reciprocal(out, out=out)
+
+
+KERNELS = {'tanh': lambda x, out: np.tanh(x, out=out),
+           'exp': lambda x, out: np.exp(x, out=out),
+           'log': lambda x, out: np.log(x, out=out),
+           'sigmoid': _sigmoid,
+           }
+EXPRS = {'tanh': 'tanh(x)', 'exp': 'exp(x)', 'log': 'log(x)', 'sigmoid': '1 / (1 + exp(-x))'}
+
+_n_threads = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+_pool = None
+_choice = dict()  # (function name -> calibrated backend)
+
+
+def set_num_threads(n):
+    """ Threads for the 'threads' (and 'numexpr') backend. """
+    global _n_threads, _pool
+    _n_threads = n
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    if numexpr is not None:
+        numexpr.set_num_threads(n)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(_n_threads)
+    return _pool
+
+
+def _run_chunks(kernel, x, out, lo, hi, chunk):
+    for i in range(lo, hi, chunk):
+        kernel(x[i:min(i + chunk, hi)], out[i:min(i + chunk, hi)])
+
+
+def apply(name, x, out=None, backend=None):
+    """ out = name(x) elementwise, by backend (None: calibrated choice). """
+    x = np.asarray(x)
+    if out is None:
+        out = np.empty(x.shape, dtype=x.dtype if x.dtype.kind == 'f' else np.float64)
+    if backend is None:
+        backend = _choice.get(name) or calibrate()[name]
+    kernel = KERNELS[name]
+    if (backend == 'numpy' or x.size < MIN_PARALLEL or x.shape != out.shape or
+            not (x.flags.c_contiguous and out.flags.c_contiguous)):
+        kernel(x, out)
+    elif backend == 'numexpr':
+        numexpr.evaluate(EXPRS[name], local_dict=dict(x=x), out=out, casting='unsafe')
+    else:
+        xf, of = x.reshape(-1), out.reshape(-1)
+        chunk = max(CHUNK_BYTES // max(x.itemsize, out.itemsize), 1)
+        if backend == 'chunked' or _n_threads == 1:
+            _run_chunks(kernel, xf, of, 0, xf.size, chunk)
+        else:
+            bounds = np.linspace(0, xf.size, _n_threads + 1).astype(np.int64)
+            list(_get_pool().map(lambda b: _run_chunks(kernel, xf, of, b[0], b[1], chunk),
+                                 zip(bounds[:-1], bounds[1:])))
+    return out
+
+
+def tanh(x, out=None, backend=None):
+    return apply('tanh', x, out, backend)
+
+
+def exp(x, out=None, backend=None):
+    return apply('exp', x, out, backend)
+
+
+def log(x, out=None, backend=None):
+    return apply('log', x, out, backend)
+
+
+def sigmoid(x, out=None, backend=None):
+    return apply('sigmoid', x, out, backend)
+
+
+def time_backend(name, backend, x, out, repeat=5):
+    apply(name, x, out, backend)  # (warmup: pool start, page faults)
+    times = []
+    for _ in range(repeat):
+        t_start = timer()
+        apply(name, x, out, backend)
+        times.append(timer() - t_start)
+    return min(times)
+
+
+def calibrate(size=2 ** 22, dtype='float32', repeat=5, verbose=False):
+    """ Time every backend on every function, make the fastest each
+    function's default; returns dict of name -> chosen backend. """
+    x = np.random.RandomState(0).rand(size).astype(dtype) + 0.5  # (log-safe)
+    out = np.empty_like(x)
+    for name in KERNELS:
+        times = {b: time_backend(name, b, x, out, repeat) for b in BACKENDS}
+        _choice[name] = min(times, key=times.get)
+        if verbose:
+            print("{:<10}".format(name) + "".join(["{:>10.2f}".format(times[b] * 1e3) for b in BACKENDS]) +
+                  "   -> {}".format(_choice[name]))
+    return dict(_choice)
+
+
+###############################################################################
+# Benchmark: backends by function and array size.                            #
+###############################################################################
+
+
+def main(sizes, dtype, n_threads):
+    if n_threads is not None:
+        set_num_threads(n_threads)
+    print("{} threads, {}, numexpr: {}".format(_n_threads, dtype,
+                                               "no" if numexpr is None else numexpr.__version__))
+    for size in sizes:
+        print("\nsize {}, time (ms)".format(size))
+        print("{:<10}".format("") + "".join(["{:>10}".format(b) for b in BACKENDS]))
+        calibrate(size, dtype, verbose=True)
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[2 ** 16, 2 ** 20, 2 ** 24])
+    parser.add_argument('-d', '--dtype', default='float32')
+    parser.add_argument('-t', '--n_threads', type=int, default=None)
+    args = parser.parse_args()
+    main(args.sizes, args.dtype, args.n_threads)
@@ -0,0 +1,12 @@
+
+"""
+Importing this initializes NumPy's BLAS (thread pool, kernel dispatch), for
+use in a preload list (see preload.py), so children forked afterwards
+inherit it ready.
+"""
+
+import numpy as np
+
+_x = np.ones((64, 64))
+_x.dot(_x)
+del _x
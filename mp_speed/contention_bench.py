@@ -0,0 +1,259 @@
+
+"""
+Shared-memory write contention benchmark, one runner for what
+sharing_speed_tests.py, share_times.py, sum_times.py and sum_share_times.py
+each measured separately (and which were compared by hand, e.g. in
+timing_Big_*.txt).
+
+Sweeps every combination of process count, vector size, dtype, layout,
+misalignment, chunk count and affinity layout.  Each configuration runs
+--repeats times.  In each repeat, every rank writes its own vector into the
+shared array n_itr times between barriers, and rank 0 then reduces across
+ranks.  Results (medians, variances over repeats) go to JSON and/or CSV,
+tagged with the host, so new machines can be characterized by one command:
+
+    python contention_bench.py -n 2 4 8 16 -d 1000 100000 --json knl.json
+
+Layouts (per-rank vectors of length vec_dim):
+    rows     one (n_proc, vec_dim) RawArray, rank writes a row
+    cols     one (vec_dim, n_proc) RawArray, rank writes a column
+    chunked  rows split over `chunks` separate RawArrays
+    padded   per_rank.PerRankArray (slots padded to avoid false sharing)
+Affinity layouts: none, compact (rank i on i-th allowed cpu), scramble
+(random permutation of compact), numa (round-robin over NUMA nodes).
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+import platform
+import itertools
+import multiprocessing as mp
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+import numpy as np
+
+import sync
+from par_copy import numa_cpus, thread_cpus
+from per_rank import PerRankArray
+
+
+LAYOUTS = ['rows', 'cols', 'chunked', 'padded']
+AFFINITIES = ['none', 'compact', 'scramble', 'numa']
+METRICS = ['write', 'write_max_rank', 'reduce']
+CACHE_LINE = 64
+
+
+###############################################################################
+# Layouts: per-rank writeable views, plus a reduction across ranks.          #
+###############################################################################
+
+
+def misaligned_array(shape, dtype, misalign=0):
+    """ RawArray-backed array whose start is misalign elements past a cache
+    line boundary. """
+    dtype = np.dtype(dtype)
+    n = int(np.prod(shape))
+    pad = CACHE_LINE // dtype.itemsize
+    x = np.frombuffer(mp.RawArray('b', (n + 2 * pad) * dtype.itemsize), dtype=dtype)
+    start = -x.ctypes.data % CACHE_LINE // dtype.itemsize + misalign % pad
+    return x[start:start + n].reshape(shape)
+
+
+def build_layout(layout, n_proc, vec_dim, dtype, misalign=0, chunks=1):
+    """ Returns (list of per-rank views, reduce function returning the sum
+    across ranks). """
+    if layout == 'rows':
+        arr = misaligned_array((n_proc, vec_dim), dtype, misalign)
+        return [arr[r] for r in range(n_proc)], lambda: arr.sum(axis=0)
+    if layout == 'cols':
+        arr = misaligned_array((vec_dim, n_proc), dtype, misalign)
+        return [arr[:, r] for r in range(n_proc)], lambda: arr.sum(axis=1)
+    if layout == 'chunked':
+        per_chunk = -(-n_proc // chunks)
+        arrs = [misaligned_array((min(per_chunk, n_proc - c * per_chunk), vec_dim), dtype, misalign)
+                for c in range(-(-n_proc // per_chunk))]
+        views = [arrs[r // per_chunk][r % per_chunk] for r in range(n_proc)]
+        return views, lambda: np.sum([a.sum(axis=0) for a in arrs], axis=0)
+    if layout == 'padded':
+        arr = PerRankArray(n_proc, (vec_dim,), dtype)
+        return [arr[r] for r in range(n_proc)], arr.sum
+    raise ValueError("Unrecognized layout: {}, available: {}".format(layout, LAYOUTS))
+
+
+def rank_cpus(affinity, n_proc):
+    """ cpu for each rank, or None (no pinning). """
+    if affinity == 'none':
+        return None
+    if affinity == 'numa':
+        return thread_cpus(n_proc)
+    cpus = sorted(os.sched_getaffinity(0))
+    compact = [cpus[r % len(cpus)] for r in range(n_proc)]
+    if affinity == 'compact':
+        return compact
+    if affinity == 'scramble':
+        return [int(c) for c in np.random.permutation(compact)]
+    raise ValueError("Unrecognized affinity: {}, available: {}".format(affinity, AFFINITIES))
+
+
+###############################################################################
+# Running one configuration.                                                 #
+###############################################################################
+
+
+def worker(rank, cpu, views, reduce, barrier, n_itr, size_X, times, t_reduce):
+    if cpu is not None:
+        os.sched_setaffinity(0, [cpu])
+    view = views[rank]
+    Y = np.random.randn(len(view)).astype(view.dtype)
+    W = np.random.randn(len(view)).astype(view.dtype)
+    if size_X > 0:
+        X = np.random.randn(size_X, size_X)
+    t_itrs = np.zeros(n_itr)
+    t_reds = np.zeros(n_itr)
+    for i in range(n_itr):
+        if size_X > 0:
+            Z = X + X  # (cycle the cache)
+            Z[0] += 1
+        barrier.wait()
+        t_start = timer()
+        view[:] = Y if i % 2 == 0 else W
+        t_itrs[i] = timer() - t_start
+        barrier.wait()
+        if rank == 0:
+            t_start = timer()
+            reduce()
+            t_reds[i] = timer() - t_start
+    times[rank] = np.median(t_itrs)
+    if rank == 0:
+        t_reduce.value = np.median(t_reds)
+
+
+def run_once(layout, n_proc, vec_dim, dtype, misalign, chunks, affinity, n_itr, size_X):
+    """ One repeat: (median write time, slowest rank's median, median reduce
+    time), in seconds. """
+    ctx = mp.get_context('fork')  # (views are inherited, not pickled)
+    views, reduce = build_layout(layout, n_proc, vec_dim, dtype, misalign, chunks)
+    cpus = rank_cpus(affinity, n_proc) or [None] * n_proc
+    barrier = sync.Barrier(n_proc)
+    times = mp.RawArray('d', n_proc)
+    t_reduce = mp.RawValue('d', 0.)
+    procs = [ctx.Process(target=worker,
+                         args=(rank, cpus[rank], views, reduce, barrier, n_itr, size_X, times, t_reduce))
+             for rank in range(n_proc)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    times = np.array(times)
+    return np.median(times), times.max(), t_reduce.value
+
+
+def configurations(args):
+    """ All distinct configurations in the sweep (chunks only matter for
+    'chunked', misalignment not for 'padded'). """
+    seen = set()
+    for n_proc, vec_dim, dtype, layout, misalign, chunks, affinity in itertools.product(
+            args.n_procs, args.vec_dims, args.dtypes, args.layouts,
+            args.misaligns, args.chunks, args.affinities):
+        chunks = chunks if layout == 'chunked' else 1
+        misalign = misalign if layout != 'padded' else 0
+        config = OrderedDict([('n_proc', n_proc), ('vec_dim', vec_dim), ('dtype', dtype),
+                              ('layout', layout), ('misalign', misalign), ('chunks', chunks),
+                              ('affinity', affinity)])
+        key = tuple(config.values())
+        if key not in seen:
+            seen.add(key)
+            yield config
+
+
+def run_config(config, repeats, n_itr, size_X):
+    samples = np.array([run_once(n_itr=n_itr, size_X=size_X, **config) for _ in range(repeats)])
+    result = OrderedDict(config)
+    for j, metric in enumerate(METRICS):
+        result[metric + '_median'] = float(np.median(samples[:, j]))
+        result[metric + '_var'] = float(np.var(samples[:, j]))
+        result[metric + '_min'] = float(np.min(samples[:, j]))
+        result[metric + '_max'] = float(np.max(samples[:, j]))
+    return result
+
+
+###############################################################################
+# Output.                                                                    #
+###############################################################################
+
+
+def machine_info():
+    return OrderedDict([('host', platform.node()),
+                        ('processor', platform.processor()),
+                        ('cpu_count', mp.cpu_count()),
+                        ('numa_nodes', len(numa_cpus())),
+                        ('python', platform.python_version()),
+                        ('numpy', np.__version__),
+                        ('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+                        ])
+
+
+def write_json(filename, info, args, results):
+    with open(filename, 'w') as f:
+        json.dump(OrderedDict([('machine', info),
+                               ('settings', OrderedDict([('repeats', args.repeats),
+                                                         ('n_itr', args.n_itr),
+                                                         ('size_X', args.size_X)])),
+                               ('results', results)]),
+                  f, indent=2)
+
+
+def write_csv(filename, info, results):
+    fields = list(info.keys()) + list(results[0].keys())
+    with open(filename, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for result in results:
+            row = dict(info)
+            row.update(result)
+            writer.writerow(row)
+
+
+def print_result(result, header=False):
+    cols = ['n_proc', 'vec_dim', 'dtype', 'layout', 'misalign', 'chunks', 'affinity']
+    if header:
+        print("".join(["{:>10}".format(c) for c in cols]) +
+              "".join(["{:>22}".format(m + " (us)") for m in METRICS]))
+    print("".join(["{:>10}".format(result[c]) for c in cols]) +
+          "".join(["{:>22.2f}".format(result[m + '_median'] * 1e6) for m in METRICS]))
+
+
+def main(args):
+    info = machine_info()
+    results = []
+    for i, config in enumerate(configurations(args)):
+        results.append(run_config(config, args.repeats, args.n_itr, args.size_X))
+        print_result(results[-1], header=(i == 0))
+    if args.json:
+        write_json(args.json, info, args, results)
+    if args.csv:
+        write_csv(args.csv, info, results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_procs', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('-d', '--vec_dims', type=int, nargs='+', default=[10000])
+    parser.add_argument('-t', '--dtypes', nargs='+', default=['float64'])
+    parser.add_argument('-l', '--layouts', nargs='+', default=LAYOUTS, choices=LAYOUTS)
+    parser.add_argument('-m', '--misaligns', type=int, nargs='+', default=[0],
+                        help="elements past a cache line boundary")
+    parser.add_argument('-c', '--chunks', type=int, nargs='+', default=[2])
+    parser.add_argument('-a', '--affinities', nargs='+', default=['compact'], choices=AFFINITIES)
+    parser.add_argument('-r', '--repeats', type=int, default=5)
+    parser.add_argument('-i', '--n_itr', type=int, default=100)
+    parser.add_argument('-X', '--size_X', type=int, default=0,
+                        help="matrix size used to cycle the cache between writes")
+    parser.add_argument('--json', help="write results to this JSON file")
+    parser.add_argument('--csv', help="write results to this CSV file")
+    main(parser.parse_args())
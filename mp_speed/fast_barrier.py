@@ -15,6 +15,7 @@ from ctypes import c_bool
 class FastBarrier(object):
     """
     WARNING: Not safe to use one of these in a loop, must use an alternating pair.
+    (Loop-safe version: sync.Barrier)
     """
 
     def __init__(self, n):
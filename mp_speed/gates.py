@@ -6,6 +6,7 @@ import time
 #################################################################
 # It's not safe to use a single pair of these gates in a loop.  #
 # Must use two pairs and alternate them.                        #
+# (Loop-safe versions: sync.py)                                 #
 #################################################################
 
 
@@ -0,0 +1,155 @@
+
+"""
+Multi-threaded bulk copy for large (shared) arrays, the threaded version of
+memcpy.py's worker processes.
+
+NumPy releases the GIL while copying, so threads in one process can drive
+several memory channels at once.  The copy is split at page boundaries of
+the destination (no two threads write into the same page or cache line),
+and runs in a persistent pool, optionally with threads pinned across NUMA
+nodes.
+
+Usage:  gbps = parallel_copy(dest, src, n_threads=8)
+"""
+
+import os
+import glob
+import itertools
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+PAGE = 4096
+CACHE_LINE = 64
+
+_pools = dict()  # key: (n_threads, numa), value: CopyPool
+
+
+def numa_cpus():
+    """ List of cpu lists, one per NUMA node (one node of all cpus if unknown). """
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist'),
+                       key=lambda p: int(p.split('node')[-1].split('/')[0])):
+        with open(path) as f:
+            nodes.append(parse_cpulist(f.read()))
+    allowed = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else set(range(mp.cpu_count()))
+    nodes = [[c for c in node if c in allowed] for node in nodes]
+    nodes = [node for node in nodes if node]
+    return nodes if nodes else [sorted(allowed)]
+
+
+def parse_cpulist(cpulist):
+    """ e.g. '0-3,8-11' -> [0, 1, 2, 3, 8, 9, 10, 11] """
+    cpus = []
+    for part in cpulist.strip().split(','):
+        if part:
+            lo, _, hi = part.partition('-')
+            cpus += list(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def thread_cpus(n_threads):
+    """ Spread threads round-robin over NUMA nodes, one cpu each. """
+    nodes = numa_cpus()
+    per_node = [itertools.cycle(node) for node in nodes]
+    return [next(per_node[i % len(nodes)]) for i in range(n_threads)]
+
+
+class CopyPool(object):
+    """ Persistent threads for parallel_copy (optionally pinned by NUMA node). """
+
+    def __init__(self, n_threads, numa=False):
+        self.n_threads = n_threads
+        self.cpus = thread_cpus(n_threads) if numa else None
+        self._next_thread = itertools.count()
+        self._executor = ThreadPoolExecutor(n_threads, initializer=self._pin)
+        self.last_time = None
+        self.last_gbps = None
+
+    def _pin(self):
+        if self.cpus is not None:
+            os.sched_setaffinity(0, [self.cpus[next(self._next_thread)]])  # (0: this thread)
+
+    def copy(self, dest, src, align=PAGE):
+        """ dest[...] = src; returns achieved bandwidth (GB/s). """
+        if dest.shape != src.shape or dest.dtype != src.dtype:
+            raise ValueError("dest and src must have the same shape and dtype.")
+        t_start = timer()
+        if dest.flags.c_contiguous and src.flags.c_contiguous:
+            d = dest.reshape(-1).view(np.uint8)
+            s = src.reshape(-1).view(np.uint8)
+            bounds = split_bytes(d.ctypes.data, d.size, self.n_threads, align)
+        else:  # (split on leading axis only)
+            d, s = dest, src
+            bounds = np.linspace(0, len(dest), self.n_threads + 1).astype(int)
+        futures = [self._executor.submit(np.copyto, d[lo:hi], s[lo:hi])
+                   for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        for f in futures:
+            f.result()
+        self.last_time = timer() - t_start
+        self.last_gbps = dest.nbytes / self.last_time / 1e9
+        return self.last_gbps
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def split_bytes(address, nbytes, n_chunks, align=PAGE):
+    """ Chunk boundaries (offsets) with every interior boundary on an
+    align-byte boundary of the absolute address. """
+    bounds = [0]
+    for i in range(1, n_chunks):
+        b = (address + i * nbytes // n_chunks) // align * align - address
+        bounds.append(min(max(b, bounds[-1]), nbytes))
+    bounds.append(nbytes)
+    return bounds
+
+
+def get_pool(n_threads=None, numa=False):
+    n_threads = mp.cpu_count() if n_threads is None else n_threads
+    key = (n_threads, numa)
+    if key not in _pools:
+        _pools[key] = CopyPool(n_threads, numa)
+    return _pools[key]
+
+
+def parallel_copy(dest, src, n_threads=None, numa=False, align=PAGE):
+    """ dest[...] = src using a persistent pool of n_threads (default: all
+    cpus).  Returns achieved bandwidth (GB/s). """
+    return get_pool(n_threads, numa).copy(dest, src, align)
+
+
+def main(size_mb, thread_counts, numa, shared, itrs):
+    shape = (size_mb * 1024 * 1024 // 4,)
+    src = np.ones(shape, dtype='float32')
+    if shared:
+        dest = np.ctypeslib.as_array(mp.RawArray('f', shape[0]))
+    else:
+        dest = np.empty(shape, dtype='float32')
+    dest[:] = 0  # (first touch outside the timing)
+    print("Copy {} MB, shared dest: {}, numa pinning: {}".format(size_mb, shared, numa))
+    t_start = timer()
+    for _ in range(itrs):
+        dest[:] = src
+    t = (timer() - t_start) / itrs
+    print("{:<16}{:>10.2f} GB/s".format("dest[:] = src", src.nbytes / t / 1e9))
+    for n in thread_counts:
+        parallel_copy(dest, src, n, numa)  # (warmup, starts the pool)
+        gbps = np.median([parallel_copy(dest, src, n, numa) for _ in range(itrs)])
+        print("{:<16}{:>10.2f} GB/s".format("threads: {}".format(n), gbps))
+    assert np.array_equal(dest, src)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--size_mb', type=int, default=1024)
+    parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--numa', action='store_true')
+    parser.add_argument('--shared', action='store_true', help="dest in mp.RawArray")
+    parser.add_argument('-i', '--itrs', type=int, default=5)
+    args = parser.parse_args()
+    main(args.size_mb, args.threads, args.numa, args.shared, args.itrs)
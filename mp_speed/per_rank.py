@@ -0,0 +1,148 @@
+
+"""
+Per-rank result arrays in shared memory without false sharing (the fix for
+the irregular write times in share_times.py / irregular_share_write_time.py,
+where ranks write adjacent rows or columns of one mp.RawArray).
+
+Each rank gets its own slot, starting on an align-byte boundary and padded
+to a multiple of align bytes, so no two ranks ever write to the same cache
+line (default 128 bytes: adjacent-line prefetch pairs lines).  Readers see
+all slots through one strided view, and reductions across ranks run on that
+view without copying.
+
+Usage:
+    results = PerRankArray(n_proc, (vec_dim,), 'float64')
+    # ...in worker rank:
+    results[rank][:] = y
+    # ...in master, after a barrier:
+    total = results.sum()           # (vec_dim,)
+    everything = results.combined   # (n_proc, vec_dim) view, no copy
+"""
+
+import argparse
+import multiprocessing as mp
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+CACHE_LINE = 64
+PAGE = 4096
+ALIGN = 2 * CACHE_LINE
+
+
+class PerRankArray(object):
+    """ One padded, aligned slot of the given shape per rank, in a single
+    mp.RawArray (pass the object to child processes as a Process arg). """
+
+    def __init__(self, n_ranks, shape, dtype='float64', align=ALIGN):
+        self.n_ranks = n_ranks
+        self.shape = tuple(int(s) for s in np.atleast_1d(shape))
+        self.dtype = np.dtype(dtype)
+        self.align = align
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.slot_bytes = max(-(-nbytes // align), 1) * align
+        self._raw = mp.RawArray('b', n_ranks * self.slot_bytes + align)
+        addr = np.ctypeslib.as_array(self._raw).ctypes.data
+        self._offset = -addr % align
+        self._build_views()
+
+    def _build_views(self):
+        buf = np.ctypeslib.as_array(self._raw)
+        item_strides = tuple(int(np.prod(self.shape[i + 1:])) * self.dtype.itemsize
+                             for i in range(len(self.shape)))
+        self.combined = np.ndarray(shape=(self.n_ranks,) + self.shape,
+                                   dtype=self.dtype,
+                                   buffer=buf,
+                                   offset=self._offset,
+                                   strides=(self.slot_bytes,) + item_strides,
+                                   )
+        self._slots = [self.combined[r] for r in range(self.n_ranks)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['combined'], state['_slots']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_views()  # (same offset into the buffer as the creator)
+
+    def __getitem__(self, rank):
+        """ This rank's slot (a contiguous, aligned view). """
+        return self._slots[rank]
+
+    def __len__(self):
+        return self.n_ranks
+
+    def gather(self, out=None):
+        """ Contiguous (n_ranks,) + shape copy of all slots. """
+        if out is None:
+            return self.combined.copy()
+        out[:] = self.combined
+        return out
+
+    def reduce(self, ufunc=np.add, out=None):
+        """ Elementwise reduction across ranks, e.g. reduce(np.maximum). """
+        return ufunc.reduce(self.combined, axis=0, out=out)
+
+    def sum(self, out=None):
+        return self.combined.sum(axis=0, out=out)
+
+    def mean(self, out=None):
+        return self.combined.mean(axis=0, out=out)
+
+    def max(self, out=None):
+        return self.combined.max(axis=0, out=out)
+
+    def min(self, out=None):
+        return self.combined.min(axis=0, out=out)
+
+
+def write_worker(rank, target, vec_dim, barrier, n_itr, times):
+    """ target: PerRankArray, or a packed (vec_dim, n_proc) array (columns). """
+    y = np.random.randn(vec_dim)
+    row = target[rank] if isinstance(target, PerRankArray) else target[:, rank]
+    t_itrs = np.zeros(n_itr)
+    for i in range(n_itr):
+        barrier.wait()
+        t_start = timer()
+        row[:] = y
+        t_itrs[i] = timer() - t_start
+    times[rank] = np.median(t_itrs)
+
+
+def time_writes(target, n_proc, vec_dim, n_itr):
+    barrier = mp.Barrier(n_proc)
+    times = mp.RawArray('d', n_proc)
+    procs = [mp.Process(target=write_worker, args=(rank, target, vec_dim, barrier, n_itr, times))
+             for rank in range(n_proc)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return np.array(times)
+
+
+def main(n_procs, vec_dim, n_itr):
+    """ Median worker write time, packed columns vs. padded per-rank slots. """
+    print("Median write time (microseconds), vec_dim: {}".format(vec_dim))
+    print("{:<10}{:>12}{:>12}{:>12}{:>12}".format(
+        "n_proc:", "packed", "(max rank)", "per_rank", "(max rank)"))
+    for n in n_procs:
+        packed = np.ctypeslib.as_array(mp.RawArray('d', n * vec_dim)).reshape(vec_dim, n)
+        t_packed = time_writes(packed, n, vec_dim, n_itr)
+        per_rank = PerRankArray(n, (vec_dim,))
+        t_per_rank = time_writes(per_rank, n, vec_dim, n_itr)
+        print("{:<10}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.1f}".format(
+            n, np.median(t_packed) * 1e6, t_packed.max() * 1e6,
+            np.median(t_per_rank) * 1e6, t_per_rank.max() * 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_procs', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('-d', '--vec_dim', type=int, default=10000)
+    parser.add_argument('-i', '--n_itr', type=int, default=100)
+    args = parser.parse_args()
+    main(args.n_procs, args.vec_dim, args.n_itr)
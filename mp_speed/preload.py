@@ -0,0 +1,114 @@
+
+"""
+Children with heavy modules already imported: a forkserver preloads them
+once, and every child is then forked from it (copy-on-write) rather than
+re-importing (cf. import_speed.py, and mp_theano_gpu*.py re-importing
+Theano in every child).
+
+Unlike plain fork, the server forks from a clean state: no parent threads,
+locks or large heaps are inherited.  Only preload modules which do not
+start GPU contexts or other per-process devices (e.g. Theano with
+device=cpu, not cuda).
+
+Usage:
+    ctx = preloaded_context(['numpy', 'theano'])
+    p = ctx.Process(target=worker, args=(...))  # (use ctx for Locks etc. too)
+
+The forkserver is one per parent process, so the preload list is set by
+the first call (before any forkserver child starts).
+"""
+
+import sys
+import argparse
+import subprocess
+import multiprocessing as mp
+from multiprocessing import forkserver
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+BLAS_MODULE = 'blas_warmup'
+
+
+def preloaded_context(preload=('numpy',), init_blas=True, start=True):
+    """ A forkserver context whose server has imported the preload modules
+    (and __main__), and initialized BLAS if init_blas.
+    start: launch the server and wait for its imports now, rather than on
+    the first Process.start(). """
+    ctx = mp.get_context('forkserver')
+    modules = ['__main__'] + list(preload)
+    if init_blas:
+        modules.append(BLAS_MODULE)
+    ctx.set_forkserver_preload(modules)
+    if start:
+        forkserver.ensure_running()
+        p = ctx.Process(target=_noop)  # (returns once the server has imported)
+        p.start()
+        p.join()
+    return ctx
+
+
+def _noop():
+    pass
+
+
+###############################################################################
+# Benchmark: time to first task under fork, spawn and preloaded forkserver.  #
+###############################################################################
+
+
+def first_task(t_launch, preload, result):
+    """ Imports (no-ops if preloaded) then one small BLAS call. """
+    for module in preload:
+        __import__(module)
+    x = np.ones((64, 64))
+    x.dot(x)
+    result.value = timer() - t_launch
+
+
+def time_first_task(ctx, preload, n_rep):
+    result = ctx.RawValue('d', 0.)
+    times = []
+    for _ in range(n_rep):
+        p = ctx.Process(target=first_task, args=(timer(), preload, result))
+        p.start()
+        p.join()
+        times.append(result.value)
+    return times
+
+
+def run_case(method, preload, n_rep):
+    """ One start method (in a fresh interpreter, since the forkserver and
+    its preload are fixed per process). """
+    if method == 'preloaded':
+        t_start = timer()
+        ctx = preloaded_context(preload)
+        t_server = timer() - t_start
+    else:
+        ctx = mp.get_context(method)
+        t_server = 0.
+    times = time_first_task(ctx, preload, n_rep)
+    print("{:<12}{:>12.1f}{:>12.1f}{:>12.1f}".format(
+        method, times[0] * 1e3, np.median(times) * 1e3, t_server * 1e3))
+
+
+def main(preload, n_rep):
+    print("Time to first task (ms), preload: {}".format(preload))
+    print("{:<12}{:>12}{:>12}{:>12}".format("method", "first", "median", "server"))
+    sys.stdout.flush()
+    for method in ['fork', 'spawn', 'preloaded']:
+        subprocess.check_call([sys.executable, __file__, '--case', method,
+                               '-r', str(n_rep), '-p'] + preload)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--preload', nargs='*', default=['numpy'])
+    parser.add_argument('-r', '--n_rep', type=int, default=10)
+    parser.add_argument('--case', default=None, help="(internal: run one start method)")
+    args = parser.parse_args()
+    if args.case is None:
+        main(args.preload, args.n_rep)
+    else:
+        run_case(args.case, args.preload, args.n_rep)
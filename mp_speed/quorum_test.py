@@ -0,0 +1,38 @@
+
+"""
+Quorum (k-of-n) barrier: the slowest n - k workers each iteration sit out
+instead of holding everyone up (cf. straggler_sema.py, barrier_break.py).
+"""
+
+import multiprocessing as mp
+import numpy as np
+import time
+
+import sync
+
+
+def worker(rank, barrier, itrs):
+    np.random.seed(rank)
+    n_missed = 0
+    for i in range(itrs):
+        time.sleep(0.01 * np.random.rand())
+        arrival = barrier.wait(rank)
+        if arrival.index is None:
+            n_missed += arrival.missed
+            print("itr: {}, worker {} missed generation {}".format(i, rank, arrival.generation))
+    barrier.depart(rank)
+    print("worker finished: {}, missed: {} of {}".format(rank, n_missed, itrs))
+
+
+def main(n_proc=10, n_sit=2, itrs=10):
+    barrier = sync.QuorumBarrier(n_proc, n_proc - n_sit)
+    processes = [mp.Process(target=worker, args=(rank, barrier, itrs)) for rank in range(n_proc)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    print("generations released: {}".format(barrier.generation))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+
+"""
+Shared-memory ring buffers of fixed-shape NumPy records, to stream arrays
+between processes without pickling or kernel buffers (cf. mp.Pipe in
+sampler/pipe_test.py and mp.Queue in queue_test.py).
+
+SPSCRing: one producer, one consumer, lock-free.  The head (items written)
+and tail (items read) counters only ever grow, and each is written by one
+side only, on its own cache line.  The producer fills slots, then advances
+head; the consumer reads slots, then advances tail.  (Relies on stores
+becoming visible in program order, as on x86.)
+
+MPSCRing: many producers, one consumer.  Producers claim slots under a lock,
+fill them outside it, and publish each slot by its sequence number, so
+producers never wait on each other's copies and the consumer sees slots in
+claim order (as in a bounded MPMC queue with per-slot sequence numbers).
+
+Both hand out zero-copy views of contiguous slots:
+    # producer:                         # consumer:
+    v = ring.reserve(n)                 v = ring.get_many(n)
+    v[:] = obs[:len(v)]                 learner_step(v)
+    ring.commit()                       ring.release()
+or copy in and out: ring.put_many(obs), ring.get_many(n, copy=True).
+A view never wraps around the end of the ring, so it may hold fewer than n
+records.  Each process may hold one reservation (or one set of gotten
+views) at a time.
+
+Create in the parent and pass to mp.Process at construction.
+"""
+
+import time
+import queue
+import argparse
+import multiprocessing as mp
+from ctypes import c_long
+from timeit import default_timer as timer
+
+import numpy as np
+
+from sync import WaitPolicy, sched_yield
+
+
+CACHE_LINE = 64
+LINE_LONGS = CACHE_LINE // 8
+MIN_SLEEP = 1e-5
+MAX_SLEEP = 1e-3
+
+
+class _Ring(object):
+    """ Slots and waiting (base class). """
+
+    def __init__(self, capacity, shape=(), dtype='float32', policy=None):
+        self.capacity = capacity
+        self.shape = tuple(int(s) for s in np.atleast_1d(shape))
+        self.dtype = np.dtype(dtype)
+        self.policy = WaitPolicy(adaptive=False) if policy is None else policy
+        slot_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._raw = mp.RawArray('b', capacity * slot_bytes + CACHE_LINE)
+        self._offset = -np.ctypeslib.as_array(self._raw).ctypes.data % CACHE_LINE
+        self._ctr = mp.RawArray(c_long, 2 * LINE_LONGS)  # head, tail on separate lines
+        self._reserved = 0  # (local: this producer's claimed, uncommitted slots)
+        self._held = 0  # (local: this consumer's gotten, unreleased slots)
+        self._build_views()
+
+    def _build_views(self):
+        n = self.capacity * int(np.prod(self.shape))
+        self._data = np.frombuffer(self._raw, dtype=self.dtype, count=n,
+                                   offset=self._offset).reshape((self.capacity,) + self.shape)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_data']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_views()
+
+    @property
+    def _head(self):
+        return self._ctr[0]
+
+    @property
+    def _tail(self):
+        return self._ctr[LINE_LONGS]
+
+    def __len__(self):
+        """ Records committed or in progress, not yet released (approximate
+        while others are active). """
+        return self._head - self._tail
+
+    def _wait(self, ready, block, timeout, exc):
+        """ Spin, yield, then sleep with backoff until ready() returns
+        nonzero; returns its value. """
+        k = ready()
+        if k or not block:
+            if k:
+                return k
+            raise exc
+        for _ in range(self.policy.spin):
+            k = ready()
+            if k:
+                return k
+        for _ in range(self.policy.n_yield):
+            sched_yield()
+            k = ready()
+            if k:
+                return k
+        deadline = None if timeout is None else timer() + timeout
+        sleep = MIN_SLEEP
+        while True:
+            time.sleep(sleep)
+            k = ready()
+            if k:
+                return k
+            if deadline is not None and timer() > deadline:
+                raise exc
+            sleep = min(2 * sleep, MAX_SLEEP)
+
+    def put(self, record, block=True, timeout=None):
+        self.reserve(1, block, timeout)[0] = record
+        self.commit()
+
+    def put_many(self, records, block=True, timeout=None):
+        """ Copy records in (as several reservations if they wrap). """
+        i = 0
+        while i < len(records):
+            view = self.reserve(len(records) - i, block, timeout)
+            view[:] = records[i:i + len(view)]
+            self.commit()
+            i += len(view)
+
+    def get(self, block=True, timeout=None):
+        """ One record (a copy). """
+        record = self.get_many(1, block, timeout)[0].copy()
+        self.release()
+        return record
+
+    def get_many(self, n, block=True, timeout=None, copy=False):
+        """ Between 1 and n records: a view of the ring (call release() when
+        done), or if copy, a copy (already released). """
+        if self._held:
+            raise RuntimeError("Release the previous get_many() before getting more.")
+        view = self._get_view(n, block, timeout)
+        self._held = len(view)
+        if copy:
+            view = view.copy()
+            self.release()
+        return view
+
+    def reserve(self, n=1, block=True, timeout=None):
+        """ Writeable view of between 1 and n free slots (call commit() after
+        filling it). """
+        if self._reserved:
+            raise RuntimeError("Commit the previous reservation before reserving more.")
+        view = self._reserve_view(n, block, timeout)
+        self._reserved = len(view)
+        return view
+
+
+class SPSCRing(_Ring):
+    """ Lock-free ring for one producer process and one consumer process. """
+
+    def _reserve_view(self, n, block, timeout):
+        head = self._head
+        start = head % self.capacity
+        limit = min(n, self.capacity - start)
+        k = self._wait(lambda: min(limit, self.capacity - (head - self._tail)),
+                       block, timeout, queue.Full)
+        return self._data[start:start + k]
+
+    def commit(self):
+        self._ctr[0] = self._head + self._reserved
+        self._reserved = 0
+
+    def _get_view(self, n, block, timeout):
+        tail = self._tail
+        start = tail % self.capacity
+        limit = min(n, self.capacity - start)
+        k = self._wait(lambda: min(limit, self._head - tail), block, timeout, queue.Empty)
+        return self._data[start:start + k]
+
+    def release(self):
+        self._ctr[LINE_LONGS] = self._tail + self._held
+        self._held = 0
+
+
+class MPSCRing(_Ring):
+    """ Ring for many producer processes and one consumer process. """
+
+    def __init__(self, capacity, shape=(), dtype='float32', policy=None):
+        self._seq_raw = mp.RawArray(c_long, capacity)
+        super(MPSCRing, self).__init__(capacity, shape, dtype, policy)
+        self._lock = mp.Lock()
+        self._claim = None  # (local: this producer's claimed position)
+        self._seq[:] = np.arange(capacity)
+
+    def _build_views(self):
+        super(MPSCRing, self)._build_views()
+        self._seq = np.ctypeslib.as_array(self._seq_raw)
+
+    def __getstate__(self):
+        state = super(MPSCRing, self).__getstate__()
+        state.pop('_seq', None)
+        return state
+
+    def _n_seq(self, pos, limit, offset):
+        """ How many slots from pos have sequence number (position + offset),
+        up to limit. """
+        start = pos % self.capacity
+        seq = self._seq[start:start + limit]
+        if limit == 1:
+            return int(seq[0] == pos + offset)
+        match = seq == np.arange(pos + offset, pos + offset + limit)
+        return limit if match.all() else int(np.argmin(match))
+
+    def _reserve_view(self, n, block, timeout):
+        with self._lock:
+            pos = self._head
+            limit = min(n, self.capacity - pos % self.capacity)
+            k = self._wait(lambda: self._n_seq(pos, limit, 0), block, timeout, queue.Full)
+            self._ctr[0] = pos + k
+        self._claim = pos
+        start = pos % self.capacity
+        return self._data[start:start + k]
+
+    def commit(self):
+        pos, k = self._claim, self._reserved
+        start = pos % self.capacity
+        self._seq[start:start + k] = np.arange(pos + 1, pos + 1 + k)
+        self._reserved = 0
+
+    def _get_view(self, n, block, timeout):
+        tail = self._tail
+        start = tail % self.capacity
+        limit = min(n, self.capacity - start)
+        k = self._wait(lambda: self._n_seq(tail, limit, 1), block, timeout, queue.Empty)
+        return self._data[start:start + k]
+
+    def release(self):
+        tail, k = self._tail, self._held
+        start = tail % self.capacity
+        self._seq[start:start + k] = np.arange(tail + self.capacity, tail + self.capacity + k)
+        self._ctr[LINE_LONGS] = tail + k
+        self._held = 0
+
+
+###############################################################################
+# Benchmark: stream records from producers to one consumer.                  #
+###############################################################################
+
+
+def ring_producer(ring, records, n_batches):
+    for _ in range(n_batches):
+        ring.put_many(records)
+
+
+def queue_producer(q, records, n_batches):
+    for _ in range(n_batches):
+        q.put(records)
+
+
+def time_ring(ring, n_prod, records, n_batches):
+    procs = [mp.Process(target=ring_producer, args=(ring, records, n_batches))
+             for _ in range(n_prod)]
+    total = n_prod * n_batches * len(records)
+    t_start = timer()
+    for p in procs:
+        p.start()
+    n = 0
+    while n < total:
+        n += len(ring.get_many(len(records)))
+        ring.release()
+    t = timer() - t_start
+    for p in procs:
+        p.join()
+    return t
+
+
+def time_queue(q, n_prod, records, n_batches):
+    procs = [mp.Process(target=queue_producer, args=(q, records, n_batches))
+             for _ in range(n_prod)]
+    t_start = timer()
+    for p in procs:
+        p.start()
+    for _ in range(n_prod * n_batches):
+        q.get()
+    t = timer() - t_start
+    for p in procs:
+        p.join()
+    return t
+
+
+def main(n_prods, obs_dim, batch, n_batches, capacity):
+    records = np.random.randn(batch, obs_dim).astype('float32')
+    print("Streaming {} batches of ({}, {}) float32 per producer".format(n_batches, batch, obs_dim))
+    print("{:<12}".format("n_prod:") + "".join(["{:>10}".format(n) for n in n_prods]) + "  (MB/s)")
+    cases = [('mp.Queue', lambda n: time_queue(mp.Queue(), n, records, n_batches))]
+    cases += [('SPSCRing', lambda n: time_ring(SPSCRing(capacity, obs_dim), n, records, n_batches))]
+    cases += [('MPSCRing', lambda n: time_ring(MPSCRing(capacity, obs_dim), n, records, n_batches))]
+    for name, run in cases:
+        line = "{:<12}".format(name)
+        for n in n_prods:
+            if name == 'SPSCRing' and n > 1:
+                line += "{:>10}".format('-')
+            else:
+                line += "{:>10.0f}".format(n * n_batches * records.nbytes / run(n) / 1e6)
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_prods', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('-d', '--obs_dim', type=int, default=100)
+    parser.add_argument('-b', '--batch', type=int, default=64)
+    parser.add_argument('-i', '--n_batches', type=int, default=1000)
+    parser.add_argument('-c', '--capacity', type=int, default=4096)
+    args = parser.parse_args()
+    main(args.n_prods, args.obs_dim, args.batch, args.n_batches, args.capacity)
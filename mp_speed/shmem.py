@@ -0,0 +1,179 @@
+
+"""
+Named shared-memory numpy arrays, page aligned, optionally on huge pages,
+optionally pre-faulted in parallel (cf. byte_aligned() in memcpy.py, which
+only aligns private arrays, and copy_worker's source-touch timing).
+
+Each segment is a file under /dev/shm (or a hugetlbfs mount, for huge
+pages) that any process can attach to by name.  The first page of the
+segment holds a small header (shape, dtype); the data starts on the next
+page boundary, so it is page (hence cache-line) aligned in every process.
+
+Usage:
+    x = shared_array('replay_obs', (10 ** 6, 84, 84), 'uint8', huge=True)
+    # ...in another process:
+    x = attach_array('replay_obs')
+    # ...when finished (any process):
+    unlink_array('replay_obs')
+"""
+
+import os
+import json
+import mmap
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+SHM_DIR = '/dev/shm'
+PAGE = mmap.PAGESIZE
+HEADER_SIZE = 4096  # (max bytes of JSON header)
+
+
+def hugetlbfs_dir():
+    """ Mount point of a hugetlbfs, or None. """
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if fields[2] == 'hugetlbfs':
+                    return fields[1]
+    except (IOError, IndexError):
+        pass
+    return None
+
+
+def shared_array(name, shape, dtype='float32', huge=False, prefault=True, n_threads=None):
+    """ Create a named shared array (zero-filled).
+
+    huge: use a hugetlbfs mount if there is one (needs reserved huge pages,
+    see /proc/sys/vm/nr_hugepages), otherwise ask for transparent huge pages
+    with madvise (effective if /sys/kernel/mm/transparent_hugepage/shmem_enabled
+    allows it).
+    prefault: touch every page now, split over n_threads threads (default all
+    cpus), so no process pays the first-touch page faults later.
+    """
+    dtype = np.dtype(dtype)
+    shape = tuple(int(s) for s in np.atleast_1d(shape))
+    hdir = hugetlbfs_dir() if huge else None
+    page = _huge_page_size() if hdir is not None else PAGE
+    offset = -(-HEADER_SIZE // page) * page
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    size = offset + -(-nbytes // page) * page
+    path = os.path.join(hdir or SHM_DIR, name)
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+    try:
+        os.ftruncate(fd, size)
+        buf = mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+    if huge and hdir is None and hasattr(mmap, 'MADV_HUGEPAGE'):
+        buf.madvise(mmap.MADV_HUGEPAGE)
+    header = json.dumps({'shape': shape, 'dtype': dtype.str, 'offset': offset}).encode()
+    buf[:len(header)] = header
+    arr = np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+    if prefault:
+        prefault_pages(arr, n_threads, page)
+    return arr
+
+
+def attach_array(name, populate=True, readonly=False):
+    """ Map an existing named shared array (created by shared_array).
+    populate: fill in this process's page tables now (MAP_POPULATE), rather
+    than faulting on first touch of each page.
+    readonly: map without write permission (returns a read-only array). """
+    path = _find(name)
+    flags = mmap.MAP_SHARED
+    if populate:
+        flags |= getattr(mmap, 'MAP_POPULATE', 0)
+    prot = mmap.PROT_READ if readonly else mmap.PROT_READ | mmap.PROT_WRITE
+    fd = os.open(path, os.O_RDONLY if readonly else os.O_RDWR)
+    try:
+        buf = mmap.mmap(fd, os.fstat(fd).st_size, flags=flags, prot=prot)
+    finally:
+        os.close(fd)
+    header = json.loads(bytes(buf[:HEADER_SIZE]).rstrip(b'\0').decode())
+    shape = tuple(header['shape'])
+    return np.frombuffer(buf, dtype=np.dtype(header['dtype']), count=int(np.prod(shape)),
+                         offset=header['offset']).reshape(shape)
+
+
+def unlink_array(name):
+    """ Remove the name; memory is freed once every process drops its mapping. """
+    os.unlink(_find(name))
+
+
+def prefault_pages(arr, n_threads=None, page=PAGE):
+    """ Write one byte per page, with pages split over threads (NumPy
+    releases the GIL for the strided writes). """
+    n_threads = mp.cpu_count() if n_threads is None else n_threads
+    flat = arr.reshape(-1).view(np.uint8)
+    n_pages = -(-flat.size // page)
+    bounds = np.linspace(0, n_pages, n_threads + 1).astype(int) * page
+
+    def touch(lo, hi):
+        flat[lo:hi:page] = 0
+
+    with ThreadPoolExecutor(n_threads) as executor:
+        list(executor.map(touch, bounds[:-1], bounds[1:]))
+
+
+def _find(name):
+    hdir = hugetlbfs_dir()
+    if hdir is not None and os.path.exists(os.path.join(hdir, name)):
+        return os.path.join(hdir, name)
+    return os.path.join(SHM_DIR, name)
+
+
+def _huge_page_size():
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('Hugepagesize:'):
+                return int(line.split()[1]) * 1024
+    return 2 * 1024 * 1024
+
+
+def touch_worker(raw, name, populate, results):
+    t_start = timer()
+    raw[::PAGE // raw.itemsize] = 1
+    results[0] = timer() - t_start
+    t_start = timer()
+    x = attach_array(name, populate)
+    results[1] = timer() - t_start
+    t_start = timer()
+    x.reshape(-1)[::PAGE // x.itemsize] = 1
+    results[2] = timer() - t_start
+
+
+def main(size_mb, huge, n_threads):
+    """ Time a worker's first write pass over an mp.RawArray vs. an attached,
+    pre-faulted shared_array. """
+    n = size_mb * 1024 * 1024 // 4
+    name = 'shmem_test_{}'.format(os.getpid())
+    raw = np.ctypeslib.as_array(mp.RawArray('f', n))
+    t_start = timer()
+    x = shared_array(name, (n,), 'float32', huge=huge, n_threads=n_threads)
+    print("shared_array alloc + prefault: {:.4f} s (aligned % 64: {})".format(
+        timer() - t_start, x.ctypes.data % 64))
+    for populate in (False, True):
+        results = mp.RawArray('d', 3)
+        p = mp.Process(target=touch_worker, args=(raw, name, populate, results))
+        p.start()
+        p.join()
+        print("\nWorker (populate={}):".format(populate))
+        print("mp.RawArray first touch:       {:.4f} s".format(results[0]))
+        print("shared_array attach:           {:.4f} s".format(results[1]))
+        print("shared_array first touch:      {:.4f} s".format(results[2]))
+    unlink_array(name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--size_mb', type=int, default=1024)
+    parser.add_argument('--huge', action='store_true')
+    parser.add_argument('-t', '--n_threads', type=int, default=None)
+    args = parser.parse_args()
+    main(args.size_mb, args.huge, args.n_threads)
@@ -0,0 +1,424 @@
+
+"""
+Loop-safe synchronization primitives for multiprocessing, distilled from
+fast_barrier.py and gates.py (which must alternate pairs in a loop).
+
+All are built the same way: arrival counts and a generation number live in
+shared memory (RawValue), guarded by one lock.  Waiters check the generation
+in shared memory following a WaitPolicy: spin, then yield the cpu, and only
+then sleep on a semaphore (paying the futex sleep/wake).
+Sleepers of even and odd generations use separate semaphores (sense
+reversal), so a fast process starting the next round can never take a
+release meant for a slow process still leaving the last one.  (Two
+generations apart, as a QuorumBarrier can be, a waiter may take such a
+permit; it then registers again and keeps waiting.)
+
+Timeouts and broken state follow threading.Barrier: a timed-out wait breaks
+the primitive, all its waiters raise BrokenBarrierError, and reset() makes
+it usable again.
+
+Create these in the parent and pass them to mp.Process at construction.
+"""
+
+import os
+import time
+import multiprocessing as mp
+from collections import namedtuple
+from threading import BrokenBarrierError
+from ctypes import c_bool, c_long, c_int
+
+
+SPIN = 100  # generation checks before yielding
+MIN_SPIN = 16
+MAX_SPIN = 1000  # (~50-100 microseconds of checks, beyond that the sleep/wake cost is small)
+N_YIELD = 10  # generation checks (each after sched_yield) before sleeping
+
+sched_yield = getattr(os, 'sched_yield', lambda: time.sleep(0))
+
+
+class WaitPolicy(object):
+    """ How long to spin and yield before sleeping on the semaphore.
+
+    If adaptive, the spin count follows recent arrival gaps (as adaptive
+    mutexes do): release while spinning doubles it (up to max_spin), having
+    to yield or sleep halves it (down to min_spin).  So short gaps on
+    dedicated cores get spun through, while long gaps, or a cpu shared with
+    the releasing process, quickly stop burning cycles.
+
+    Each process holds its own copy (and adapts to its own arrival gaps).
+    """
+
+    def __init__(self, spin=SPIN, n_yield=N_YIELD, adaptive=True,
+                 min_spin=MIN_SPIN, max_spin=MAX_SPIN):
+        self.spin = spin
+        self.n_yield = n_yield
+        self.adaptive = adaptive
+        self.min_spin = min_spin
+        self.max_spin = max_spin
+
+    def update(self, spun):
+        """ Record whether the release arrived while spinning. """
+        if self.adaptive:
+            if spun:
+                self.spin = min(self.max_spin, 2 * self.spin)
+            else:
+                self.spin = max(self.min_spin, self.spin // 2)
+
+
+SLEEP = dict(spin=0, n_yield=0, adaptive=False)  # (block immediately, as gates.py)
+SPIN_SLEEP = dict(spin=MAX_SPIN, n_yield=0, adaptive=False)  # (spin MAX_SPIN checks, then block: no yields)
+
+
+class _GenerationSync(object):
+    """ Shared generation counter with spin/yield/sleep waiting (base class). """
+
+    def __init__(self, timeout=None, policy=None):
+        self.timeout = timeout
+        self.policy = WaitPolicy() if policy is None else policy
+        self._lock = mp.Lock()
+        self._gen = mp.RawValue(c_long, 0)
+        self._epoch = mp.RawValue(c_long, 0)  # (incremented by reset)
+        self._broken = mp.RawValue(c_bool, False)
+        self._n_sleep = mp.RawArray(c_int, 2)  # sleepers, by generation parity
+        self._semas = (mp.Semaphore(0), mp.Semaphore(0))
+
+    @property
+    def broken(self):
+        return self._broken.value
+
+    def abort(self):
+        """ Put into broken state: current and future waiters raise
+        BrokenBarrierError (until reset). """
+        with self._lock:
+            self._break()
+
+    def reset(self):
+        """ Return to the initial state; any current waiters raise
+        BrokenBarrierError. """
+        with self._lock:
+            self._break()
+            self._reset_counts()
+            self._broken.value = False
+            self._epoch.value += 1
+
+    def _reset_counts(self):
+        pass
+
+    def _advance(self):
+        """ Start the next generation, wake its sleepers (hold lock). """
+        sense = self._gen.value & 1
+        self._gen.value += 1
+        n = self._n_sleep[sense]
+        self._n_sleep[sense] = 0
+        sema = self._semas[sense]
+        [sema.release() for _ in range(n)]  # (list comprehension fastest, see fast_barrier.py)
+
+    def _break(self):
+        """ (Hold lock.) """
+        self._broken.value = True
+        for sense in (0, 1):
+            n = self._n_sleep[sense]
+            self._n_sleep[sense] = 0
+            [self._semas[sense].release() for _ in range(n)]
+
+    def _check(self, epoch):
+        if self._broken.value or self._epoch.value != epoch:
+            raise BrokenBarrierError
+
+    def _wait_gen(self, gen, epoch, timeout):
+        """ Block until the generation moves past gen.  Returns False on
+        timeout (no longer registered as waiting), raises if broken. """
+        shared_gen = self._gen
+        policy = self.policy
+        n_spin = policy.spin
+        for _ in range(n_spin):
+            if shared_gen.value != gen:
+                policy.update(True)
+                return True
+            self._check(epoch)
+        policy.update(False)
+        for _ in range(policy.n_yield):
+            sched_yield()
+            if shared_gen.value != gen:
+                return True
+            self._check(epoch)
+        sense = gen & 1
+        with self._lock:
+            if shared_gen.value != gen:
+                return True
+            self._check(epoch)
+            self._n_sleep[sense] += 1
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not self._semas[sense].acquire(timeout=remaining):
+                break
+            if shared_gen.value != gen:
+                return True
+            with self._lock:
+                if shared_gen.value != gen:
+                    return True
+                self._check(epoch)  # (woken by abort or reset)
+                # Took a permit released for an earlier generation of the same
+                # parity, whose sleeper has yet to take it (and will take one
+                # released for ours instead): register again and keep waiting.
+                self._n_sleep[sense] += 1
+        with self._lock:
+            if shared_gen.value != gen or self._broken.value or self._epoch.value != epoch:
+                # Released just after timing out: a permit is ours, take it.
+                self._semas[sense].acquire()
+                if shared_gen.value != gen:
+                    return True
+                raise BrokenBarrierError
+            self._n_sleep[sense] -= 1
+        return False
+
+
+class Barrier(_GenerationSync):
+    """ Reusable barrier, safe to use in a loop (interface of mp.Barrier,
+    without action). """
+
+    def __init__(self, parties, timeout=None, policy=None):
+        super(Barrier, self).__init__(timeout, policy)
+        self.parties = parties
+        self._count = mp.RawValue(c_int, 0)
+
+    @property
+    def n_waiting(self):
+        return self._count.value
+
+    def wait(self, timeout=None):
+        """ Returns arrival index in range(parties). """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._broken.value:
+                raise BrokenBarrierError
+            gen = self._gen.value
+            epoch = self._epoch.value
+            index = self._count.value
+            if index == self.parties - 1:
+                self._count.value = 0
+                self._advance()
+                return index
+            self._count.value = index + 1
+        if not self._wait_gen(gen, epoch, timeout):
+            self.abort()
+            raise BrokenBarrierError
+        return index
+
+    def _reset_counts(self):
+        self._count.value = 0
+
+
+Arrival = namedtuple('Arrival', ['generation', 'missed', 'index'])
+
+
+class QuorumBarrier(_GenerationSync):
+    """ Partial barrier: each generation releases once quorum (k) of the
+    n participants have arrived, without waiting for stragglers.
+
+    wait(rank) returns Arrival(generation, missed, index):
+    generation -- the generation this call was counted in (or missed)
+    missed -- generations released without this rank since its last call
+    index -- arrival order within the generation (None if not counted)
+
+    A straggler whose generation was already released returns at once
+    (index None), and its next call joins the current generation.  With
+    rejoin=True it instead joins the current generation right away and
+    waits for it.
+
+    Participants finishing early call depart(rank), so the quorum becomes
+    min(k, participants remaining) and the others don't wait on them.
+    """
+
+    def __init__(self, n, k, timeout=None, policy=None, rejoin=False):
+        super(QuorumBarrier, self).__init__(timeout, policy)
+        if not 0 < k <= n:
+            raise ValueError("Need 0 < k <= n (got k={}, n={}).".format(k, n))
+        self.n = n
+        self.k = k
+        self.rejoin = rejoin
+        self._count = mp.RawValue(c_int, 0)
+        self._n_active = mp.RawValue(c_int, n)
+        self._expect = mp.RawArray(c_long, n)  # (next generation, per rank)
+
+    @property
+    def generation(self):
+        return self._gen.value
+
+    def wait(self, rank, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._broken.value:
+                raise BrokenBarrierError
+            gen = self._gen.value
+            epoch = self._epoch.value
+            expected = self._expect[rank]
+            missed = gen - expected
+            if missed > 0 and not self.rejoin:
+                self._expect[rank] = gen
+                return Arrival(expected, missed, None)
+            index = self._count.value
+            self._expect[rank] = gen + 1
+            if index >= min(self.k, self._n_active.value) - 1:
+                self._count.value = 0
+                self._advance()
+                return Arrival(gen, missed, index)
+            self._count.value = index + 1
+        if not self._wait_gen(gen, epoch, timeout):
+            self.abort()
+            raise BrokenBarrierError
+        return Arrival(gen, missed, index)
+
+    def depart(self, rank):
+        """ Leave permanently (until reset); releases the current generation
+        if the remaining participants already make quorum. """
+        with self._lock:
+            self._n_active.value -= 1
+            self._expect[rank] = -1
+            count = self._count.value
+            if count > 0 and count >= min(self.k, self._n_active.value):
+                self._count.value = 0
+                self._advance()
+
+    def _reset_counts(self):
+        self._count.value = 0
+        self._n_active.value = self.n
+        self._expect[:] = [self._gen.value] * self.n
+
+
+class ManyBlocksOneGate(_GenerationSync):
+    """ Master waits for all workers to check in (workers don't block).
+    Loop-safe version of gates.ManyBlocksOneGate. """
+
+    def __init__(self, n_blockers, timeout=None, policy=None):
+        super(ManyBlocksOneGate, self).__init__(timeout, policy)
+        self.n_blockers = n_blockers
+        self._count = mp.RawValue(c_int, 0)
+        self._rounds = mp.RawValue(c_long, 0)  # (completed waits)
+
+    def checkin(self):
+        with self._lock:
+            if self._broken.value:
+                raise BrokenBarrierError
+            self._count.value += 1
+            if self._count.value == self.n_blockers:
+                self._count.value = 0
+                self._advance()
+
+    def wait(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        epoch = self._epoch.value
+        self._check(epoch)
+        if not self._wait_gen(self._rounds.value, epoch, timeout):
+            self.abort()
+            raise BrokenBarrierError
+        self._rounds.value += 1
+
+    def _reset_counts(self):
+        self._count.value = 0
+        self._rounds.value = self._gen.value
+
+
+class OneBlocksManyGate(_GenerationSync):
+    """ All workers wait for the master to release them.
+    Loop-safe version of gates.OneBlocksManyGate; each release lets every
+    worker through exactly once. The master must not release again before
+    all workers have passed (e.g. pair with ManyBlocksOneGate). """
+
+    def __init__(self, n_waiters, timeout=None, policy=None):
+        super(OneBlocksManyGate, self).__init__(timeout, policy)
+        self.n_waiters = n_waiters
+        self._passed = mp.RawArray(c_long, n_waiters)  # (releases passed, per rank)
+
+    def release(self):
+        with self._lock:
+            if self._broken.value:
+                raise BrokenBarrierError
+            self._advance()
+
+    def wait(self, rank, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        epoch = self._epoch.value
+        self._check(epoch)
+        if not self._wait_gen(self._passed[rank], epoch, timeout):
+            self.abort()
+            raise BrokenBarrierError
+        self._passed[rank] += 1
+
+    def _reset_counts(self):
+        self._passed[:] = [self._gen.value] * self.n_waiters
+
+
+class GatePair(object):
+    """ Master/worker handoff: workers check in to the master, the master
+    releases all workers.
+
+    Master loop:  gates.wait_workers(); ...; gates.release_workers()
+    Worker loop:  gates.checkin(); gates.wait_master(rank); ...
+    """
+
+    def __init__(self, n_workers, timeout=None, policy=None):
+        self.step = ManyBlocksOneGate(n_workers, timeout, policy)
+        self.act = OneBlocksManyGate(n_workers, timeout, policy)
+
+    def checkin(self):
+        self.step.checkin()
+
+    def wait_master(self, rank, timeout=None):
+        self.act.wait(rank, timeout)
+
+    def wait_workers(self, timeout=None):
+        self.step.wait(timeout)
+
+    def release_workers(self):
+        self.act.release()
+
+    def abort(self):
+        self.step.abort()
+        self.act.abort()
+
+    def reset(self):
+        self.step.reset()
+        self.act.reset()
+
+
+class CountDownLatch(_GenerationSync):
+    """ Waiters block until count_down() has been called count times.
+    Reusable via reset(count). """
+
+    def __init__(self, count, timeout=None, policy=None):
+        super(CountDownLatch, self).__init__(timeout, policy)
+        self.initial_count = count
+        self._count = mp.RawValue(c_int, count)
+
+    @property
+    def count(self):
+        return self._count.value
+
+    def count_down(self):
+        with self._lock:
+            if self._count.value > 0:
+                self._count.value -= 1
+                if self._count.value == 0:
+                    self._advance()
+
+    def wait(self, timeout=None):
+        """ Returns False if timed out (the latch is not broken). """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._broken.value:
+                raise BrokenBarrierError
+            if self._count.value == 0:
+                return True
+            gen = self._gen.value
+            epoch = self._epoch.value
+        return self._wait_gen(gen, epoch, timeout)
+
+    def reset(self, count=None):
+        if count is not None:
+            self.initial_count = count
+        super(CountDownLatch, self).reset()
+
+    def _reset_counts(self):
+        self._count.value = self.initial_count
@@ -0,0 +1,108 @@
+
+"""
+Round-trip latency of the sync.py primitives against mp.Barrier, sweeping
+the number of processes and the wait policy (use --pin on dedicated cores).
+
+Barrier: every process waits n_itr times in a loop; time per wait.
+Gates: master wait_workers() / release_workers(), workers checkin() /
+wait_master(); time per master-worker round trip.
+"""
+
+import multiprocessing as mp
+import argparse
+import psutil
+from timeit import default_timer as timer
+
+import sync
+
+
+def set_affinity(rank, pin):
+    if pin:
+        cpus = psutil.Process().cpu_affinity()
+        psutil.Process().cpu_affinity([cpus[rank % len(cpus)]])
+
+
+def barrier_target(rank, barrier, n_itr, pin, result):
+    set_affinity(rank, pin)
+    for _ in range(10):  # (warmup)
+        barrier.wait()
+    t_start = timer()
+    for _ in range(n_itr):
+        barrier.wait()
+    if rank == 0:
+        result.value = (timer() - t_start) / n_itr
+
+
+def gate_worker(rank, gates, n_itr, pin):
+    set_affinity(rank + 1, pin)
+    for _ in range(n_itr + 10):
+        gates.checkin()
+        gates.wait_master(rank)
+
+
+def gate_master(gates, n_itr, pin):
+    set_affinity(0, pin)
+    for _ in range(10):
+        gates.wait_workers()
+        gates.release_workers()
+    t_start = timer()
+    for _ in range(n_itr):
+        gates.wait_workers()
+        gates.release_workers()
+    return (timer() - t_start) / n_itr
+
+
+def time_barrier(barrier, n_proc, n_itr, pin):
+    result = mp.RawValue('d', 0.)
+    procs = [mp.Process(target=barrier_target, args=(rank, barrier, n_itr, pin, result))
+             for rank in range(n_proc)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return result.value
+
+
+def time_gates(gates, n_proc, n_itr, pin):
+    n_worker = n_proc - 1
+    procs = [mp.Process(target=gate_worker, args=(rank, gates, n_itr, pin))
+             for rank in range(n_worker)]
+    for p in procs:
+        p.start()
+    t = gate_master(gates, n_itr, pin)
+    for p in procs:
+        p.join()
+    return t
+
+
+POLICIES = {'sleep': sync.SLEEP,
+            'spin-sleep': sync.SPIN_SLEEP,
+            'yield': dict(spin=0, adaptive=False),
+            'hybrid': dict(adaptive=False),
+            'adaptive': dict(),
+            }
+
+
+def main(n_procs, n_itr, policies, pin):
+    cases = [('mp.Barrier', lambda n: time_barrier(mp.Barrier(n), n, n_itr, pin))]
+    for name in policies:
+        kwargs = POLICIES[name]
+        cases += [('sync.Barrier ' + name,
+                   lambda n, k=kwargs: time_barrier(sync.Barrier(n, policy=sync.WaitPolicy(**k)), n, n_itr, pin)),
+                  ('sync.GatePair ' + name,
+                   lambda n, k=kwargs: time_gates(sync.GatePair(n - 1, policy=sync.WaitPolicy(**k)), n, n_itr, pin))]
+    print("Round-trip latency (microseconds), {} itrs".format(n_itr))
+    print("{:<28}".format("n_proc:") + "".join(["{:>10}".format(n) for n in n_procs]))
+    for name, run in cases:
+        times = [run(n) for n in n_procs]
+        print("{:<28}".format(name) + "".join(["{:>10.1f}".format(t * 1e6) for t in times]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_procs', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('-i', '--n_itr', type=int, default=10000)
+    parser.add_argument('-p', '--policies', nargs='+', default=sorted(POLICIES), choices=sorted(POLICIES))
+    parser.add_argument('--pin', action='store_true', help="pin one process per cpu")
+    args = parser.parse_args()
+    main(args.n_procs, args.n_itr, args.policies, args.pin)
@@ -0,0 +1,241 @@
+
+"""
+Pool of pre-started, warm worker processes for short jobs, so each job pays
+neither process start nor heavy imports (mp_process_start_speed.py measures
+those, per iteration, for a fresh mp.Process).
+
+Workers start once, import the preload modules, optionally pin to a cpu,
+and then wait for task descriptors.  A descriptor is one fixed-dtype record
+in a shared-memory ring (ring.py): task id, function index, up to MAX_ARGS
+numeric arguments, and optionally the name of a shmem.shared_array, which
+the worker attaches (once) and passes as the first argument.  Results come
+back the same way, as one float per task.
+
+Usage:
+    pool = WarmPool([evaluate], n_workers=8, preload=['numpy', 'theano'],
+                    cpus=thread_cpus(8))
+    scores = pool.map(evaluate, [(seed,) for seed in range(100)])
+    pool.close()
+"""
+
+import os
+import queue
+import argparse
+import importlib
+import itertools
+import multiprocessing as mp
+from timeit import default_timer as timer
+
+import numpy as np
+
+from ring import SPSCRing, MPSCRing
+from shmem import attach_array
+
+
+MAX_ARGS = 8
+NAME_LEN = 64
+STOP = -1
+READY = -1  # (task id of each worker's startup report)
+OK = 0
+ERROR = 1
+POLL = 0.1  # (seconds between checks for dead workers while waiting)
+
+TASK_DTYPE = np.dtype([('task', 'i8'), ('func', 'i4'), ('n_args', 'i4'),
+                       ('args', 'f8', (MAX_ARGS,)), ('array', 'S{}'.format(NAME_LEN))])
+RESULT_DTYPE = np.dtype([('task', 'i8'), ('worker', 'i4'), ('status', 'i4'), ('value', 'f8')])
+
+
+def worker_main(rank, funcs, preload, cpu, tasks, results, t_launch):
+    if cpu is not None:
+        os.sched_setaffinity(0, [cpu])
+    for module in preload:
+        importlib.import_module(module)
+    results.put((READY, rank, OK, timer() - t_launch))
+    arrays = dict()
+    while True:
+        task = tasks.get()
+        if task['func'] == STOP:
+            break
+        args = [float(a) for a in task['args'][:task['n_args']]]
+        name = task['array'].decode()
+        try:
+            if name:
+                if name not in arrays:
+                    arrays[name] = attach_array(name)
+                args = [arrays[name]] + args
+            value = funcs[task['func']](*args)
+            results.put((task['task'], rank, OK, np.nan if value is None else value))
+        except Exception:
+            results.put((task['task'], rank, ERROR, np.nan))
+
+
+class WarmPool(object):
+    """ Persistent workers running registered functions on numeric arguments.
+
+    funcs: list of functions the workers may run (top-level, picklable).
+    preload: modules each worker imports at startup.
+    cpus: cpu for each worker (e.g. par_copy.thread_cpus(n_workers)), or None.
+    """
+
+    def __init__(self, funcs, n_workers=None, preload=('numpy',), cpus=None,
+                 capacity=256):
+        self.funcs = list(funcs)
+        self.n_workers = mp.cpu_count() if n_workers is None else n_workers
+        self._tasks = [SPSCRing(capacity, (), TASK_DTYPE) for _ in range(self.n_workers)]
+        self._results = MPSCRing(capacity * self.n_workers, (), RESULT_DTYPE)
+        self._task_ids = itertools.count()
+        self._pending = [0] * self.n_workers
+        self._done = dict()
+        cpus = [None] * self.n_workers if cpus is None else cpus
+        t_launch = timer()
+        self._procs = [mp.Process(target=worker_main,
+                                  args=(rank, self.funcs, list(preload), cpus[rank],
+                                        self._tasks[rank], self._results, t_launch))
+                       for rank in range(self.n_workers)]
+        for p in self._procs:
+            p.start()
+        ready = []
+        while len(ready) < self.n_workers:  # (a worker may die in preload or pinning)
+            try:
+                ready.append(self._results.get(timeout=POLL))
+            except queue.Empty:
+                dead = self._dead_workers()
+                if dead:
+                    self._terminate()
+                    raise RuntimeError("Worker(s) died during startup, (rank, exit code): {}".format(dead))
+        self.startup_time = timer() - t_launch  # (until all workers ready)
+        self.worker_startup = [r['value'] for r in sorted(ready, key=lambda r: r['worker'])]
+
+    def submit(self, func, args=(), array=None):
+        """ Queue one task on the least loaded worker; returns task id. """
+        if len(args) > MAX_ARGS:
+            raise ValueError("At most {} arguments per task.".format(MAX_ARGS))
+        task = np.zeros((), TASK_DTYPE)
+        task['task'] = next(self._task_ids)
+        task['func'] = func if isinstance(func, int) else self.funcs.index(func)
+        task['n_args'] = len(args)
+        task['args'][:len(args)] = args
+        task['array'] = b'' if array is None else array.encode()
+        rank = int(np.argmin(self._pending))
+        while True:
+            try:
+                self._tasks[rank].put(task, block=False)
+                break
+            except queue.Full:  # (workers may be blocked on a full result ring)
+                self._take_result()
+        self._pending[rank] += 1
+        return int(task['task'])
+
+    def _dead_workers(self):
+        return [(rank, p.exitcode) for rank, p in enumerate(self._procs) if p.exitcode is not None]
+
+    def _terminate(self):
+        for p in self._procs:
+            if p.exitcode is None:
+                p.terminate()
+            p.join()
+
+    def _take_result(self, timeout=POLL, check=True):
+        """ Move one result (if any within timeout) into self._done; raises
+        if a worker has died (if check). """
+        try:
+            r = self._results.get(timeout=timeout)
+        except queue.Empty:
+            dead = self._dead_workers() if check else None
+            if dead:
+                raise RuntimeError("Worker(s) died, (rank, exit code): {}".format(dead))
+            return
+        self._pending[r['worker']] -= 1
+        self._done[int(r['task'])] = (int(r['status']), float(r['value']))
+
+    def result(self, task_id, timeout=None):
+        """ Block until the task is done (or raise TimeoutError after timeout
+        seconds); returns its value. """
+        t_start = timer()
+        while task_id not in self._done:
+            remaining = POLL if timeout is None else timeout - (timer() - t_start)
+            if remaining <= 0:
+                raise TimeoutError("Task {} not done in {} s.".format(task_id, timeout))
+            self._take_result(min(POLL, remaining))
+        status, value = self._done.pop(task_id)
+        if status != OK:
+            raise RuntimeError("Task {} raised an exception in its worker.".format(task_id))
+        return value
+
+    def map(self, func, arg_list, array=None, timeout=None):
+        task_ids = [self.submit(func, args, array) for args in arg_list]
+        return [self.result(t, timeout) for t in task_ids]
+
+    def close(self, timeout=10.):
+        """ Stop the workers after their queued tasks (skipping dead ones);
+        any still running after timeout seconds are terminated. """
+        stop = np.zeros((), TASK_DTYPE)
+        stop['func'] = STOP
+        deadline = timer() + timeout
+        for tasks, p in zip(self._tasks, self._procs):
+            while p.exitcode is None and timer() < deadline:
+                try:
+                    tasks.put(stop, block=False)
+                    break
+                except queue.Full:  # (worker may be blocked on a full result ring)
+                    self._take_result(check=False)
+        for p in self._procs:
+            while p.exitcode is None and timer() < deadline:
+                self._take_result(check=False)  # (unblock workers still putting results)
+                p.join(0)
+        self._terminate()
+
+
+###############################################################################
+# Benchmark: short tasks, in a fresh mp.Process each vs. in the warm pool.   #
+###############################################################################
+
+
+def short_task(n):
+    import numpy
+    return float(numpy.arange(int(n)).sum())
+
+
+def process_target(n, preload):
+    for module in preload:
+        importlib.import_module(module)
+    short_task(n)
+
+
+def time_processes(n_tasks, n_workers, preload):
+    t_start = timer()
+    for i in range(0, n_tasks, n_workers):
+        procs = [mp.Process(target=process_target, args=(1000, preload))
+                 for _ in range(min(n_workers, n_tasks - i))]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+    return (timer() - t_start) / n_tasks
+
+
+def main(n_tasks, n_workers, preload):
+    t_proc = time_processes(n_tasks, n_workers, preload)
+    pool = WarmPool([short_task], n_workers, preload)
+    t_start = timer()
+    pool.map(short_task, [(1000,)] * n_tasks)
+    t_pool = (timer() - t_start) / n_tasks
+    pool.close()
+    print("Preload: {}, {} workers, {} tasks".format(preload, n_workers, n_tasks))
+    print("mp.Process per task:   {:10.1f} ms/task".format(t_proc * 1e3))
+    print("WarmPool per task:     {:10.3f} ms/task".format(t_pool * 1e3))
+    print("WarmPool startup:      {:10.1f} ms (slowest worker ready: {:.1f} ms)".format(
+        pool.startup_time * 1e3, max(pool.worker_startup) * 1e3))
+    print("Pool pays off after:   {:10.1f} tasks".format(pool.startup_time / max(t_proc - t_pool, 1e-9)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--n_tasks', type=int, default=100)
+    parser.add_argument('-n', '--n_workers', type=int, default=4)
+    parser.add_argument('-p', '--preload', nargs='*', default=['numpy'])
+    parser.add_argument('-m', '--start_method', default=None, choices=['fork', 'spawn', 'forkserver'])
+    args = parser.parse_args()
+    if args.start_method is not None:
+        mp.set_start_method(args.start_method)
+    main(args.n_tasks, args.n_workers, args.preload)
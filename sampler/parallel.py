@@ -0,0 +1,246 @@
+
+"""
+Parallel sampler: worker processes each step a slice of environments and
+write observations straight into shared-memory batch arrays (rows per
+worker), while the master runs one batched policy forward per time step and
+writes the actions back (get_action.py and sequential.py time only that
+forward pass).
+
+Master and workers hand off through sync.GatePair (the loop-safe version of
+the step/act gates in gates.py): workers check in when their rows of obs[t]
+are written, the master computes act[t] and releases them to step.
+
+With alternate=True the environments form two groups (half of each
+worker's), each with its own GatePair: the master computes actions for one
+group while the workers step the other, so inference and stepping overlap
+(up to twice the throughput when the two phases take equally long).
+
+Buffers hold a whole batch of horizon steps, (horizon, n_envs_total, ...),
+so no step's data is copied: obs[t] is the input at step t, and rew[t],
+done[t] its outcome (an environment done at t is reset, and obs[t + 1]
+holds its first observation).
+
+Usage:
+    sampler = ParallelSampler(make_env, n_workers=8, n_envs=4, horizon=128,
+                              obs_shape=(64,), alternate=True)
+    batch = sampler.sample(policy)       # policy(obs) -> actions
+    batch['obs'], batch['act'], batch['rew'], batch['done']
+    sampler.close()
+Environments: reset() -> obs, step(action) -> (obs, reward, done).
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing as mp
+from ctypes import c_long
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mp_speed'))
+from sync import GatePair  # noqa: E402
+
+
+STOP = 0  # (ctrl indexes: stop flag, then current time step of each group)
+STEP = 1
+
+
+def shared_buffers(specs):
+    """ RawArray per (name, shape, dtype); build views with buffer_views(). """
+    return {name: (mp.RawArray('b', max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)),
+                   shape, dtype)
+            for name, shape, dtype in specs}
+
+
+def buffer_views(buffers):
+    return {name: np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            for name, (raw, shape, dtype) in buffers.items()}
+
+
+def worker_main(rank, make_env, groups, buffers, gates, ctrl, cpu):
+    """ groups: this worker's rows in each group (stepped in turn). """
+    if cpu is not None:
+        os.sched_setaffinity(0, [cpu])
+    bufs = buffer_views(buffers)
+    obs, act, rew, done = bufs['obs'], bufs['act'], bufs['rew'], bufs['done']
+    envs = [[make_env(i) for i in rows] for rows in groups]
+    for g, rows in enumerate(groups):
+        for i, env in zip(rows, envs[g]):
+            obs[0, i] = env.reset()
+        gates[g].checkin()
+    while True:
+        for g, rows in enumerate(groups):
+            gates[g].wait_master(rank)
+            if ctrl[STOP]:
+                return
+            t = ctrl[STEP + g]
+            for i, env in zip(rows, envs[g]):
+                o, r, d = env.step(act[t, i])
+                if d:
+                    o = env.reset()
+                obs[t + 1, i] = o
+                rew[t, i] = r
+                done[t, i] = d
+            gates[g].checkin()
+
+
+class ParallelSampler(object):
+    """ n_workers processes, each stepping n_envs environments.
+
+    make_env: make_env(row) returns an environment (top-level, picklable).
+    horizon: time steps per sample() batch.
+    alternate: two groups of environments, stepped while the other's
+    actions are computed (n_envs must be even).  Group g is the contiguous
+    block of rows self.groups[g].
+    cpus: cpu for each worker (e.g. par_copy.thread_cpus(n_workers)), or None.
+    """
+
+    def __init__(self, make_env, n_workers, n_envs, horizon, obs_shape, act_shape=(),
+                 act_dtype='int64', obs_dtype='float32', alternate=False, cpus=None,
+                 gate_policy=None):
+        n_groups = 2 if alternate else 1
+        if n_envs % n_groups:
+            raise ValueError("Alternating groups need an even n_envs (got {}).".format(n_envs))
+        self.n_workers = n_workers
+        self.n_envs = n_envs
+        self.horizon = horizon
+        B = n_workers * n_envs
+        self._buffers = shared_buffers([('obs', (horizon + 1, B) + tuple(obs_shape), obs_dtype),
+                                        ('act', (horizon, B) + tuple(act_shape), act_dtype),
+                                        ('rew', (horizon, B), 'float32'),
+                                        ('done', (horizon, B), 'bool'),
+                                        ])
+        self.buffers = buffer_views(self._buffers)
+        G = B // n_groups  # (rows per group; worker rank has k of them in each)
+        k = n_envs // n_groups
+        self.groups = [slice(g * G, (g + 1) * G) for g in range(n_groups)]
+        self._gates = [GatePair(n_workers, policy=gate_policy) for _ in range(n_groups)]
+        self._ctrl = mp.RawArray(c_long, 1 + n_groups)
+        cpus = [None] * n_workers if cpus is None else cpus
+        self._procs = [mp.Process(target=worker_main,
+                                  args=(rank, make_env,
+                                        [range(g * G + rank * k, g * G + (rank + 1) * k)
+                                         for g in range(n_groups)],
+                                        self._buffers, self._gates, self._ctrl, cpus[rank]))
+                       for rank in range(n_workers)]
+        for p in self._procs:
+            p.start()
+        for gates in self._gates:
+            gates.wait_workers()  # (obs[0] reset)
+        self._first = True
+
+    def sample(self, policy):
+        """ Run horizon steps; returns dict of views of the shared buffers
+        (overwritten by the next call: copy what must be kept). """
+        obs, act = self.buffers['obs'], self.buffers['act']
+        if not self._first:
+            obs[0] = obs[-1]  # (continue where the last batch ended)
+        self._first = False
+        for t in range(self.horizon):
+            for g, (rows, gates) in enumerate(zip(self.groups, self._gates)):
+                if t > 0:
+                    gates.wait_workers()  # (this group's obs[t] written)
+                act[t, rows] = policy(obs[t, rows])
+                self._ctrl[STEP + g] = t
+                gates.release_workers()
+        for gates in self._gates:
+            gates.wait_workers()
+        return self.buffers
+
+    def close(self):
+        self._ctrl[STOP] = 1
+        for gates in self._gates:
+            gates.release_workers()
+        for p in self._procs:
+            p.join()
+
+
+###############################################################################
+# Benchmark: steps/sec vs. workers and envs per worker, sync vs. alternating.#
+###############################################################################
+
+
+class BusyEnv(object):
+    """ Random-walk environment costing step_time seconds of cpu per step. """
+
+    def __init__(self, seed, obs_dim=64, n_actions=8, step_time=1e-4, max_len=200):
+        self.rng = np.random.RandomState(seed)
+        self.moves = self.rng.randn(n_actions, obs_dim).astype('float32')
+        self.step_time = step_time
+        self.max_len = max_len
+
+    def reset(self):
+        self.t = 0
+        self.state = self.rng.randn(len(self.moves[0])).astype('float32')
+        return self.state
+
+    def step(self, action):
+        t_end = timer() + self.step_time
+        while timer() < t_end:  # (simulated simulator work)
+            pass
+        self.state = 0.9 * self.state + self.moves[action]
+        self.t += 1
+        return self.state, float(-np.abs(self.state).mean()), self.t >= self.max_len
+
+
+class MLPPolicy(object):
+
+    def __init__(self, obs_dim, n_actions, hidden=256, seed=0):
+        rng = np.random.RandomState(seed)
+        self.W1 = (rng.randn(obs_dim, hidden) / np.sqrt(obs_dim)).astype('float32')
+        self.W2 = (rng.randn(hidden, n_actions) / np.sqrt(hidden)).astype('float32')
+
+    def __call__(self, obs):
+        return np.tanh(obs.dot(self.W1)).dot(self.W2).argmax(axis=1)
+
+
+class EnvMaker(object):
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def __call__(self, index):
+        return BusyEnv(index, **self.kwargs)
+
+
+def time_sampler(make_env, policy, n_workers, n_envs, horizon, n_batches, obs_dim, alternate):
+    sampler = ParallelSampler(make_env, n_workers, n_envs, horizon, (obs_dim,), alternate=alternate)
+    sampler.sample(policy)  # (warmup)
+    t_start = timer()
+    for _ in range(n_batches):
+        sampler.sample(policy)
+    t = timer() - t_start
+    sampler.close()
+    return n_batches * horizon * n_workers * n_envs / t
+
+
+def main(worker_counts, env_counts, horizon, n_batches, step_time, obs_dim, hidden):
+    policy = MLPPolicy(obs_dim, 8, hidden)
+    make_env = EnvMaker(obs_dim=obs_dim, step_time=step_time)
+    print("Env steps/sec, env step {} ms, obs_dim {}, hidden {}, horizon {}".format(
+        step_time * 1e3, obs_dim, hidden, horizon))
+    for alternate in [False, True]:
+        print("\n" + ("alternating groups" if alternate else "synchronous"))
+        print("{:<12}".format("envs\\workers") + "".join(["{:>10}".format(n) for n in worker_counts]))
+        for n_envs in env_counts:
+            if alternate and n_envs % 2:
+                continue
+            rates = [time_sampler(make_env, policy, n_workers, n_envs, horizon, n_batches, obs_dim, alternate)
+                     for n_workers in worker_counts]
+            print("{:<12}".format(n_envs) + "".join(["{:>10.0f}".format(r) for r in rates]))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--n_workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('-e', '--n_envs', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('-t', '--horizon', type=int, default=64)
+    parser.add_argument('-b', '--n_batches', type=int, default=5)
+    parser.add_argument('-s', '--step_time', type=float, default=1e-4, help="env cpu seconds per step")
+    parser.add_argument('-d', '--obs_dim', type=int, default=64)
+    parser.add_argument('--hidden', type=int, default=256, help="policy hidden units (inference cost)")
+    args = parser.parse_args()
+    main(args.n_workers, args.n_envs, args.horizon, args.n_batches, args.step_time, args.obs_dim,
+         args.hidden)
@@ -0,0 +1,233 @@
+
+"""
+Trajectory store for rollouts of variable-length paths, without allocating
+and concatenating per iteration (concat_test.py compares np.concatenate of
+a list of paths with writing them one by one into a preallocated array).
+
+Each field (obs, act, rew, ...) is one preallocated 2-D (or n-D) buffer of
+rows, doubled (in whole chunks) when full, so copying on growth is
+amortized O(1) per row, and clear() keeps the capacity, so after the first
+few iterations appending never allocates.  Paths are recorded by start and
+end row, so any path, or all data so far, is a view (of the current
+buffer: growth reallocates it, and earlier views no longer see new writes).
+
+Returns and GAE advantages are computed for all paths at once: a backward
+pass over time steps, each step vectorized across every path still active
+at that length (so max path length numpy operations, not total steps).
+
+Usage:
+    buf = TrajectoryBuffer(dict(obs=((64,), 'float32'), act=((), 'int64'),
+                                rew=((), 'float32'), val=((), 'float32')))
+    buf.append_path(obs=obs, act=act, rew=rew, val=val)   # (per path)
+    adv = buf.advantages(gamma=0.99, lam=0.95)
+    ret = adv + buf['val']
+    for idx in buf.minibatches(256):
+        train(buf['obs'][idx], buf['act'][idx], adv[idx], ret[idx])
+    buf.clear()
+"""
+
+import sys
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+CHUNK = 4096  # (rows)
+
+
+class TrajectoryBuffer(object):
+    """ fields: dict of name -> (row shape, dtype).
+    capacity: initial rows; grows (at least doubling) in whole chunks of
+    chunk rows. """
+
+    def __init__(self, fields, capacity=CHUNK, chunk=CHUNK):
+        self.fields = {name: (tuple(shape), np.dtype(dtype)) for name, (shape, dtype) in fields.items()}
+        self.chunk = chunk
+        self.capacity = max(-(-capacity // chunk), 1) * chunk
+        self._data = {name: np.empty((self.capacity,) + shape, dtype)
+                      for name, (shape, dtype) in self.fields.items()}
+        self._starts = np.zeros(64, dtype=np.int64)
+        self._ends = np.zeros(64, dtype=np.int64)
+        self.n_paths = 0
+        self.n_steps = 0
+
+    def clear(self):
+        """ Drop all paths (keeps the allocated capacity). """
+        self.n_paths = 0
+        self.n_steps = 0
+
+    def _reserve(self, n_steps):
+        if n_steps > self.capacity:
+            capacity = -(-max(n_steps, 2 * self.capacity) // self.chunk) * self.chunk
+            for name, (shape, dtype) in self.fields.items():
+                data = np.empty((capacity,) + shape, dtype)
+                data[:self.n_steps] = self._data[name][:self.n_steps]
+                self._data[name] = data
+            self.capacity = capacity
+        if self.n_paths == len(self._starts):
+            self._starts = np.concatenate([self._starts, np.zeros_like(self._starts)])
+            self._ends = np.concatenate([self._ends, np.zeros_like(self._ends)])
+
+    def append_path(self, **arrays):
+        """ Copy in one path: an array for every field, all of equal length. """
+        if set(arrays) != set(self.fields):
+            raise ValueError("Need arrays for fields: {}, got: {}".format(sorted(self.fields), sorted(arrays)))
+        lengths = {len(x) for x in arrays.values()}
+        if len(lengths) != 1:
+            raise ValueError("Path fields differ in length: {}".format(
+                {name: len(x) for name, x in arrays.items()}))
+        length = lengths.pop()
+        start = self.n_steps
+        self._reserve(start + length)
+        for name, x in arrays.items():
+            self._data[name][start:start + length] = x
+        self._starts[self.n_paths] = start
+        self._ends[self.n_paths] = start + length
+        self.n_paths += 1
+        self.n_steps += length
+        return self.n_paths - 1
+
+    def reserve_path(self, length):
+        """ Claim rows for one path without copying; returns (index, dict of
+        views) to write the path into (e.g. straight from a sampler).  Fill
+        the views before the next append or reserve: if that grows the
+        buffer, they point into the old one and writes to them are lost. """
+        start = self.n_steps
+        self._reserve(start + length)
+        self._starts[self.n_paths] = start
+        self._ends[self.n_paths] = start + length
+        self.n_paths += 1
+        self.n_steps += length
+        return self.n_paths - 1, self.path(self.n_paths - 1)
+
+    @property
+    def starts(self):
+        return self._starts[:self.n_paths]
+
+    @property
+    def ends(self):
+        return self._ends[:self.n_paths]
+
+    @property
+    def lengths(self):
+        return self.ends - self.starts
+
+    def __getitem__(self, name):
+        """ All rows of a field so far (a view). """
+        return self._data[name][:self.n_steps]
+
+    def path(self, i, name=None):
+        """ Views of path i: dict of fields, or one field. """
+        start, end = self._starts[i], self._ends[i]
+        if name is not None:
+            return self._data[name][start:end]
+        return {n: d[start:end] for n, d in self._data.items()}
+
+    def discounted_sum(self, x, discount, last=None):
+        """ y[t] = x[t] + discount * y[t + 1] within each path, over all rows
+        (x: (n_steps,) array), with y[end] = last[path] (scalar or one per
+        path, default 0). """
+        starts, ends = self.starts, self.ends
+        y = np.empty(self.n_steps, dtype=np.result_type(x, np.float32))
+        acc = np.zeros(self.n_paths, dtype=y.dtype)
+        if last is not None:
+            acc[:] = np.asarray(last, dtype=y.dtype).reshape(-1)
+        order = np.argsort(ends - starts)[::-1]  # (longest first: active paths are a prefix)
+        lengths = (ends - starts)[order]
+        ends, acc = ends[order], acc[order]
+        n_active = len(lengths)
+        for j in range(int(lengths[0]) if len(lengths) else 0):
+            while lengths[n_active - 1] <= j:
+                n_active -= 1
+            rows = ends[:n_active] - 1 - j
+            acc[:n_active] = x[rows] + discount * acc[:n_active]
+            y[rows] = acc[:n_active]
+        return y
+
+    def returns(self, gamma, rew='rew', last_values=None):
+        """ Discounted returns of every row; last_values bootstraps paths
+        cut off before terminating (value of the state after each path). """
+        return self.discounted_sum(self[rew], gamma, last_values)
+
+    def advantages(self, gamma, lam, rew='rew', val='val', last_values=None):
+        """ Generalized advantage estimates of every row (GAE(gamma, lam)). """
+        values = self[val]
+        next_values = np.empty_like(values)
+        next_values[:-1] = values[1:]
+        last = np.zeros(self.n_paths, dtype=values.dtype)
+        if last_values is not None:
+            last[:] = np.asarray(last_values, dtype=values.dtype).reshape(-1)
+        nonempty = self.lengths > 0  # (an empty path's end - 1 is the previous path's last row)
+        next_values[self.ends[nonempty] - 1] = last[nonempty]
+        deltas = self[rew] + gamma * next_values - values
+        return self.discounted_sum(deltas, gamma * lam)
+
+    def minibatches(self, batch_size, shuffle=True, rng=np.random):
+        """ Yield index arrays covering all rows once. """
+        idx = rng.permutation(self.n_steps) if shuffle else np.arange(self.n_steps)
+        for i in range(0, self.n_steps, batch_size):
+            yield idx[i:i + batch_size]
+
+
+###############################################################################
+# Benchmark: concatenate per iteration vs. buffer, and per-path returns.     #
+###############################################################################
+
+
+def path_returns(rew, gamma):
+    y = np.empty_like(rew)
+    acc = 0.
+    for t in range(len(rew) - 1, -1, -1):
+        acc = rew[t] + gamma * acc
+        y[t] = acc
+    return y
+
+
+def main(n_paths, max_path, obs_dim, n_itr):
+    rng = np.random.RandomState(0)
+    paths = [dict(obs=rng.randn(n, obs_dim).astype('float32'), rew=rng.randn(n).astype('float32'))
+             for n in rng.randint(1, max_path, n_paths)]
+    n_steps = sum(len(p['rew']) for p in paths)
+    print("{} paths (up to {} steps, {} total), obs_dim {}".format(n_paths, max_path, n_steps, obs_dim))
+
+    t_start = timer()
+    for _ in range(n_itr):
+        obs = np.concatenate([p['obs'] for p in paths])
+        rew = np.concatenate([p['rew'] for p in paths])
+        ret = np.concatenate([path_returns(p['rew'], 0.99) for p in paths])
+    t_concat = (timer() - t_start) / n_itr
+
+    buf = TrajectoryBuffer(dict(obs=((obs_dim,), 'float32'), rew=((), 'float32')))
+    t_append = t_ret = 0.
+    for _ in range(n_itr):
+        buf.clear()
+        t_start = timer()
+        for p in paths:
+            buf.append_path(**p)
+        t_append += timer() - t_start
+        t_start = timer()
+        ret_buf = buf.returns(0.99)
+        t_ret += timer() - t_start
+    assert np.allclose(ret, ret_buf, rtol=1e-4, atol=1e-4)
+    assert np.array_equal(obs, buf['obs']) and np.array_equal(rew, buf['rew'])
+
+    t_start = timer()
+    for _ in range(n_itr):
+        [path_returns(p['rew'], 0.99) for p in paths]
+    t_loop = (timer() - t_start) / n_itr
+    print("concatenate + per-path returns: {:8.2f} ms".format(t_concat * 1e3))
+    print("buffer append:                  {:8.2f} ms".format(t_append / n_itr * 1e3))
+    print("per-path returns (loop):        {:8.2f} ms".format(t_loop * 1e3))
+    print("buffer returns (vectorized):    {:8.2f} ms".format(t_ret / n_itr * 1e3))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--n_paths', type=int, default=100)
+    parser.add_argument('-m', '--max_path', type=int, default=100)
+    parser.add_argument('-d', '--obs_dim', type=int, default=100)
+    parser.add_argument('-i', '--n_itr', type=int, default=10)
+    args = parser.parse_args()
+    main(args.n_paths, args.max_path, args.obs_dim, args.n_itr)
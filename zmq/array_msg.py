@@ -0,0 +1,241 @@
+
+"""
+NumPy arrays over ZeroMQ: one multipart message per array (or per batch of
+arrays), with a compact binary header frame, instead of separate dtype and
+shape string frames (seventh.py) or a JSON header message (multi_pair.py).
+
+Message frames:
+    header: count (uint32), packed (uint8), then per array: length of
+            dtype.str (uint8), dtype.str, ndim (uint8), shape (ndim x uint64)
+    data:   one frame per array, or if packed, all arrays in one frame
+            (each starting a multiple of ALIGN bytes from the frame start;
+            zmq does not align received frames themselves, so received
+            arrays are only as aligned as their frame)
+
+Receiving with copy=False returns np.frombuffer views of the zmq frames
+(no copy; the arrays keep the frames alive).  Batches of
+small arrays are packed into one data frame by default, so a batch costs
+one header and one buffer however many arrays it holds.
+
+Sending is zero-copy by default too (copy=False): zmq reads large unpacked
+arrays from their own memory after send returns, so don't modify one until
+the message is sent (pass track=True and wait on the returned tracker), or
+send with copy=True.  Structured and object dtypes are not supported.
+
+Usage:
+    send_array(socket, x)              x = recv_array(socket)
+    send_arrays(socket, [obs, rew])    obs, rew = recv_arrays(socket)
+"""
+
+import sys
+import struct
+import operator
+from functools import reduce
+import argparse
+import multiprocessing as mp
+from timeit import default_timer as timer
+
+import numpy as np
+import zmq
+
+
+HEAD = struct.Struct('<IB')
+ALIGN = 16
+PACK_BELOW = 2 ** 16  # (bytes: pack a batch into one frame if total is smaller)
+
+SHAPES = [struct.Struct('<{}Q'.format(n)) for n in range(65)]  # (by ndim)
+
+_dtypes = dict()  # (dtype.str bytes -> np.dtype)
+_codes = dict()  # (np.dtype -> header bytes: dtype.str length and dtype.str)
+
+
+def _size(shape):
+    return reduce(operator.mul, shape, 1)  # (np.prod is slow on small tuples)
+
+
+def pack_header(arrays, packed):
+    parts = [HEAD.pack(len(arrays), packed)]
+    for x in arrays:
+        code = _codes.get(x.dtype)
+        if code is None:
+            if x.dtype.fields is not None or x.dtype.hasobject:
+                raise ValueError("Unsupported dtype (structured or object): {}".format(x.dtype))
+            name = x.dtype.str.encode()
+            code = _codes[x.dtype] = bytes([len(name)]) + name
+        parts.append(code)
+        parts.append(bytes([x.ndim]))
+        parts.append(SHAPES[x.ndim].pack(*x.shape))
+    return b''.join(parts)
+
+
+def unpack_header(header):
+    """ Returns (packed, list of (dtype, shape)). """
+    count, packed = HEAD.unpack_from(header, 0)
+    pos = HEAD.size
+    specs = []
+    for _ in range(count):
+        n = header[pos]
+        name = bytes(header[pos + 1:pos + 1 + n])
+        ndim = header[pos + 1 + n]
+        pos += n + 2
+        shape = SHAPES[ndim].unpack_from(header, pos)
+        pos += SHAPES[ndim].size
+        if name not in _dtypes:
+            _dtypes[name] = np.dtype(name.decode())
+        specs.append((_dtypes[name], shape))
+    return bool(packed), specs
+
+
+def _offsets(nbytes):
+    """ Start of each array in a packed frame, and the frame size. """
+    offsets = []
+    pos = 0
+    for n in nbytes:
+        offsets.append(pos)
+        pos += -(-n // ALIGN) * ALIGN
+    return offsets, pos
+
+
+def pack_arrays(arrays, pack_below=PACK_BELOW):
+    """ Message frames (header, data...) for a list of arrays. """
+    arrays = [np.asarray(x) for x in arrays]
+    arrays = [x if x.flags.c_contiguous else x.copy() for x in arrays]
+    nbytes = [x.nbytes for x in arrays]
+    packed = len(arrays) > 1 and sum(nbytes) < pack_below
+    if packed:
+        offsets, size = _offsets(nbytes)
+        buf = np.empty(size, dtype=np.uint8)
+        for x, o, n in zip(arrays, offsets, nbytes):
+            buf[o:o + n] = x.reshape(-1).view(np.uint8)
+        frames = [buf]
+    else:  # (datetimes don't export the buffer interface: send their bytes)
+        frames = [x.reshape(-1).view(np.uint8) if x.dtype.kind in 'mM' else x for x in arrays]
+    return [pack_header(arrays, packed)] + frames
+
+
+def unpack_arrays(frames, copy=False):
+    """ List of arrays from received frames (zmq.Frame objects if not copy,
+    else bytes). """
+    header = frames[0] if copy else frames[0].bytes
+    packed, specs = unpack_header(header)
+    bufs = [f if copy else f.buffer for f in frames[1:]]
+    if packed:
+        sizes = [_size(shape) for _, shape in specs]
+        offsets, _ = _offsets([dtype.itemsize * n for (dtype, _), n in zip(specs, sizes)])
+        return [np.frombuffer(bufs[0], dtype=dtype, count=n, offset=o).reshape(shape)
+                for (dtype, shape), n, o in zip(specs, sizes, offsets)]
+    return [np.frombuffer(b, dtype=dtype).reshape(shape) for b, (dtype, shape) in zip(bufs, specs)]
+
+
+def send_arrays(socket, arrays, flags=0, copy=False, track=False, pack_below=PACK_BELOW):
+    """ Send a list of arrays as one multipart message (copy=False: don't
+    modify the arrays until sent, see module docstring). """
+    return socket.send_multipart(pack_arrays(arrays, pack_below), flags=flags, copy=copy, track=track)
+
+
+def recv_arrays(socket, flags=0, copy=False):
+    """ Receive a list of arrays (views of the frames, if not copy). """
+    return unpack_arrays(socket.recv_multipart(flags=flags, copy=copy), copy)
+
+
+def send_array(socket, x, flags=0, copy=False, track=False):
+    return send_arrays(socket, [x], flags, copy, track)
+
+
+def recv_array(socket, flags=0, copy=False):
+    return recv_arrays(socket, flags, copy)[0]
+
+
+###############################################################################
+# Benchmark: string frames vs. JSON header vs. binary header (and batching). #
+###############################################################################
+
+
+def send_strings(socket, x):
+    socket.send_string(x.dtype.name, zmq.SNDMORE)
+    socket.send_string(str(x.shape).lstrip('(').rstrip(')').rstrip(','), zmq.SNDMORE)
+    socket.send(x, copy=False)
+
+
+def recv_strings(socket):
+    dtype = socket.recv_string()
+    shape = socket.recv_string()
+    shape = [int(s) for s in shape.split(',')] if shape else ()
+    return np.frombuffer(socket.recv(copy=False).buffer, dtype=dtype).reshape(shape)
+
+
+def send_json(socket, x):
+    socket.send_json(dict(dtype=x.dtype.name, shape=x.shape), zmq.SNDMORE)
+    socket.send(x, copy=False)
+
+
+def recv_json(socket):
+    md = socket.recv_json()
+    return np.frombuffer(socket.recv(copy=False).buffer, dtype=md['dtype']).reshape(md['shape'])
+
+
+def send_one_batch(socket, xs):
+    for x in xs:
+        send_array(socket, x)
+
+
+def recv_one_batch(socket, n):
+    return [recv_array(socket) for _ in range(n)]
+
+
+METHODS = {'strings': (lambda s, xs: [send_strings(s, x) for x in xs],
+                       lambda s, n: [recv_strings(s) for _ in range(n)]),
+           'json': (lambda s, xs: [send_json(s, x) for x in xs],
+                    lambda s, n: [recv_json(s) for _ in range(n)]),
+           'binary': (send_one_batch, recv_one_batch),
+           'batched': (send_arrays, lambda s, n: recv_arrays(s)),
+           }
+
+
+def receiver(address, method, batch, n_msg):
+    socket = zmq.Context.instance().socket(zmq.PAIR)
+    socket.connect(address)
+    recv = METHODS[method][1]
+    socket.send(b'ready')
+    for _ in range(n_msg):
+        recv(socket, batch)
+    socket.send(b'done')
+    socket.close()
+    zmq.Context.instance().term()  # (flush before the process exits)
+
+
+def time_method(host, method, size, batch, n_msg):
+    socket = zmq.Context.instance().socket(zmq.PAIR)
+    address = "{}:{}".format(host, socket.bind_to_random_port(host))
+    p = mp.Process(target=receiver, args=(address, method, batch, n_msg))
+    p.start()
+    xs = [np.ones(size, dtype='float32') for _ in range(batch)]
+    send = METHODS[method][0]
+    socket.recv()  # (ready)
+    t_start = timer()
+    for _ in range(n_msg):
+        send(socket, xs)
+    socket.recv()
+    t = timer() - t_start
+    p.join()
+    socket.close()
+    return t / (n_msg * batch)
+
+
+def main(sizes, batch, n_msg, host):
+    print("Time per array (microseconds), float32, batch of {} arrays".format(batch))
+    print("{:<10}".format("size:") + "".join(["{:>12}".format(s) for s in sizes]))
+    for method in ['strings', 'json', 'binary', 'batched']:
+        times = [time_method(host, method, s, batch, n_msg) for s in sizes]
+        print("{:<10}".format(method) + "".join(["{:>12.2f}".format(t * 1e6) for t in times]))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1, 100, 10000, 1000000])
+    parser.add_argument('-b', '--batch', type=int, default=16)
+    parser.add_argument('-n', '--n_msg', type=int, default=200)
+    parser.add_argument('--host', default="tcp://127.0.0.1")
+    args = parser.parse_args()
+    main(args.sizes, args.batch, args.n_msg, args.host)
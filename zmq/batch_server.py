@@ -0,0 +1,274 @@
+
+"""
+One asyncio (zmq.asyncio) process serving array requests from many actor
+processes, with dynamic batching: requests which arrive while a batch is
+being computed are coalesced into the next one, so a single NumPy (or
+Theano) forward pass serves many clients.
+
+Requests and replies use array_msg.py framing.  The server's compute
+function takes one batch, the row-wise concatenation of all pending
+requests' arrays, and returns an array (or tuple of arrays) with one row
+per input row; each client gets back its own rows.  Only compatible
+requests share a batch (same number of arrays, trailing shapes and dtypes);
+others wait for a later one.  compute runs in an executor thread, so the
+event loop keeps receiving meanwhile.  A malformed request (e.g. arrays
+with different row counts) gets an error reply, and if compute fails every
+client in its batch does; BatchClient.request raises these as RuntimeError.
+
+Usage:
+    server = BatchServer("tcp://*:5580", policy.forward, max_batch=1024)
+    server.run(n_clients=64)             # (returns once all have closed)
+    # ...in each actor process:
+    client = BatchClient("tcp://127.0.0.1:5580")
+    actions, values = client.request(obs)
+    client.close()
+"""
+
+import sys
+import asyncio
+import argparse
+import multiprocessing as mp
+from timeit import default_timer as timer
+
+import numpy as np
+import zmq
+import zmq.asyncio
+
+from array_msg import pack_arrays, unpack_arrays
+
+
+GOODBYE = b''
+OK = b'K'  # (reply status frames)
+ERROR = b'X'
+
+
+def signature(arrays):
+    """ Requests batch together if these match: per array, trailing shape
+    and dtype. """
+    return tuple((x.shape[1:], x.dtype.str) for x in arrays)
+
+
+class BatchServer(object):
+    """ max_batch: rows per compute call (requests are never split).
+    max_wait: seconds to wait for more requests after the first arrives
+    (0: just take what is pending). """
+
+    def __init__(self, address, compute, max_batch=1024, max_wait=0.):
+        self.address = address
+        self.compute = compute
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_rows = 0
+        self.n_errors = 0
+        self.t_compute = 0.
+        self._pending = []  # (identity, arrays)
+        self._n_pending_rows = 0
+        self._n_goodbye = 0
+
+    @property
+    def mean_batch(self):
+        return self.n_rows / max(self.n_batches, 1)
+
+    def run(self, n_clients=None):
+        asyncio.run(self.serve(n_clients))
+
+    async def serve(self, n_clients=None):
+        """ Serve until n_clients have said goodbye (None: forever); an
+        unexpected error in the receive or batch loop is raised from here. """
+        ctx = zmq.asyncio.Context.instance()
+        self._socket = ctx.socket(zmq.ROUTER)
+        self._socket.setsockopt(zmq.RCVHWM, 0)
+        self._socket.bind(self.address)
+        self.address = self._socket.getsockopt_string(zmq.LAST_ENDPOINT)
+        self._arrived = asyncio.Event()
+        self._done = asyncio.Event()
+        self._n_clients = n_clients
+        receiver = asyncio.ensure_future(self._receive())
+        batcher = asyncio.ensure_future(self._batch())
+        done = asyncio.ensure_future(self._done.wait())
+        tasks = [receiver, batcher, done]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self._socket.close()
+        for r in results:
+            if isinstance(r, Exception) and not isinstance(r, asyncio.CancelledError):
+                raise r
+
+    async def _receive(self):
+        while True:
+            frames = await self._socket.recv_multipart(copy=False)
+            identity = frames[0].bytes
+            if len(frames) == 2 and frames[1].bytes == GOODBYE:
+                self._n_goodbye += 1
+                if self._n_clients is not None and self._n_goodbye >= self._n_clients:
+                    self._done.set()
+                continue
+            try:
+                arrays = unpack_arrays(frames[1:])
+                if not arrays or any(np.ndim(x) == 0 for x in arrays):
+                    raise ValueError("Requests need arrays with a row dimension.")
+                if len({len(x) for x in arrays}) > 1:
+                    raise ValueError("Request arrays differ in rows: {}".format([len(x) for x in arrays]))
+            except Exception as e:
+                self.n_errors += 1
+                await self._socket.send_multipart(
+                    [identity, ERROR, "{}: {}".format(type(e).__name__, e).encode()])
+                continue
+            self._pending.append((identity, arrays))
+            self._n_pending_rows += len(arrays[0])
+            self._arrived.set()
+
+    async def _batch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._arrived.wait()
+            if self.max_wait > 0 and self._n_pending_rows < self.max_batch:
+                deadline = loop.time() + self.max_wait
+                while self._n_pending_rows < self.max_batch and loop.time() < deadline:
+                    self._arrived.clear()
+                    try:
+                        await asyncio.wait_for(self._arrived.wait(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+            requests = self._take()
+            if self._pending:
+                self._arrived.set()  # (left over: start the next batch right away)
+            else:
+                self._arrived.clear()
+            bounds = np.cumsum([0] + [len(arrays[0]) for _, arrays in requests])
+            try:
+                inputs = [np.concatenate(parts) for parts in zip(*[arrays for _, arrays in requests])]
+                t_start = timer()
+                outputs = await loop.run_in_executor(None, self.compute, *inputs)
+                self.t_compute += timer() - t_start
+                outputs = list(outputs) if isinstance(outputs, (tuple, list)) else [outputs]
+                if any(len(y) != bounds[-1] for y in outputs):
+                    raise ValueError("compute returned {} rows for a batch of {}.".format(
+                        [len(y) for y in outputs], bounds[-1]))
+                replies = [[identity, OK] + pack_arrays([y[lo:hi] for y in outputs])
+                           for (identity, _), lo, hi in zip(requests, bounds[:-1], bounds[1:])]
+            except Exception as e:
+                self.n_errors += 1
+                message = "{}: {}".format(type(e).__name__, e).encode()
+                replies = [[identity, ERROR, message] for identity, _ in requests]
+            for reply in replies:
+                await self._socket.send_multipart(reply, copy=False)
+            self.n_requests += len(requests)
+            self.n_batches += 1
+            self.n_rows += int(bounds[-1])
+
+    def _take(self):
+        """ Pending requests compatible with the oldest, oldest first, up to
+        max_batch rows (at least one); the rest stay pending. """
+        kind = signature(self._pending[0][1])
+        requests, rest = [], []
+        n = 0
+        full = False
+        for request in self._pending:
+            rows = len(request[1][0])
+            if full or signature(request[1]) != kind:
+                rest.append(request)
+            elif requests and n + rows > self.max_batch:
+                full = True
+                rest.append(request)
+            else:
+                requests.append(request)
+                n += rows
+        self._pending = rest
+        self._n_pending_rows -= n
+        return requests
+
+
+class BatchClient(object):
+    """ Blocking client for one actor process. """
+
+    def __init__(self, address):
+        self._socket = zmq.Context.instance().socket(zmq.DEALER)
+        self._socket.connect(address)
+
+    def request(self, *arrays):
+        """ Send arrays (rows: this client's environments); returns the
+        server's outputs for those rows (a list if compute returns several).
+        Raises RuntimeError if the server failed on this request's batch. """
+        self._socket.send_multipart(pack_arrays(arrays), copy=False)
+        frames = self._socket.recv_multipart(copy=False)
+        if frames[0].bytes == ERROR:
+            raise RuntimeError("Server error: {}".format(frames[1].bytes.decode()))
+        outputs = unpack_arrays(frames[1:])
+        return outputs if len(outputs) > 1 else outputs[0]
+
+    def close(self):
+        self._socket.send(GOODBYE)
+        self._socket.close(linger=-1)
+
+
+###############################################################################
+# Demo: linear policy served to many actors, with and without batching.      #
+###############################################################################
+
+
+class LinearPolicy(object):
+
+    def __init__(self, obs_dim, n_actions, seed=0):
+        self.W = np.random.RandomState(seed).randn(obs_dim, n_actions).astype('float32')
+
+    def __call__(self, obs):
+        logits = obs.dot(self.W)
+        return logits.argmax(axis=1), logits.max(axis=1)
+
+
+def actor(address, n_envs, obs_dim, n_steps):
+    client = BatchClient(address)
+    obs = np.random.randn(n_envs, obs_dim).astype('float32')
+    for _ in range(n_steps):
+        actions, values = client.request(obs)
+    client.close()
+    zmq.Context.instance().term()
+
+
+def run(n_clients, n_envs, obs_dim, n_steps, max_batch):
+    server = BatchServer("tcp://127.0.0.1:*", LinearPolicy(obs_dim, 16), max_batch)
+
+    async def main_async():
+        serving = asyncio.ensure_future(server.serve(n_clients))
+        while server.address.endswith('*'):  # (until bound)
+            await asyncio.sleep(0.01)
+        procs = [mp.Process(target=actor, args=(server.address, n_envs, obs_dim, n_steps))
+                 for _ in range(n_clients)]
+        t_start = timer()
+        for p in procs:
+            p.start()
+        await serving
+        t = timer() - t_start
+        for p in procs:
+            p.join()
+        return t
+
+    t = asyncio.run(main_async())
+    print("{:<10}{:>10}{:>12}{:>14.0f}{:>14.1f}{:>12.1f}".format(
+        n_clients, max_batch, server.n_batches, server.n_requests / t, server.mean_batch,
+        100 * server.t_compute / t))
+    sys.stdout.flush()
+
+
+def main(n_clients_list, n_envs, obs_dim, n_steps):
+    print("{} envs per client, obs_dim {}, {} steps".format(n_envs, obs_dim, n_steps))
+    print("{:<10}{:>10}{:>12}{:>14}{:>14}{:>12}".format(
+        "clients", "max_batch", "batches", "requests/s", "mean rows", "compute %"))
+    for n_clients in n_clients_list:
+        for max_batch in [n_envs, 1024]:  # (no coalescing vs. dynamic batching)
+            run(n_clients, n_envs, obs_dim, n_steps, max_batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--n_clients', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('-e', '--n_envs', type=int, default=8)
+    parser.add_argument('-d', '--obs_dim', type=int, default=128)
+    parser.add_argument('-n', '--n_steps', type=int, default=200)
+    args = parser.parse_args()
+    main(args.n_clients, args.n_envs, args.obs_dim, args.n_steps)
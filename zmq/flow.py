@@ -0,0 +1,252 @@
+
+"""
+Credit-based flow control for zmq array pipelines (array_msg.py framing),
+instead of sleeps and barriers around PUB/SUB (np_pubsub.py) and unbounded
+queues.
+
+Each consumer grants each producer a window of credits; a producer spends
+one credit per message and may only send with credit left.  The consumer
+returns credits as it takes messages out of recv() (batched, every
+credit_batch messages), so at most `window` messages per producer are ever
+in flight or queued, and nothing is lost in zmq's queues.
+
+Producers connect to one or more consumers and send each message to the
+consumer with the most credit (load balancing by actual consumer speed).
+With no credit anywhere, the policy decides:
+    'block'  wait for credit (up to timeout, then raise TimeoutError)
+    'drop'   discard the message, return False
+
+Usage:
+    consumer = Consumer("tcp://*:5570", window=16)
+    producer = Producer(["tcp://127.0.0.1:5570"], policy='block')
+    producer.send([obs, rew])           # (in the producer process)
+    sender, (obs, rew) = consumer.recv()
+Metrics: producer.metrics() (including max_outstanding: the most messages
+ever sent to one consumer and not yet acknowledged, i.e. in flight, queued,
+or taken by recv() since its last credit return), consumer.metrics().
+"""
+
+import sys
+import time
+import struct
+import argparse
+import multiprocessing as mp
+from collections import defaultdict
+from timeit import default_timer as timer
+
+import numpy as np
+import zmq
+
+from array_msg import pack_arrays, unpack_arrays
+
+
+DATA = b'D'
+HELLO = b'H'
+CREDIT = b'C'
+END = b'E'
+N_CREDIT = struct.Struct('<I')
+POLICIES = ['block', 'drop']
+
+
+class Producer(object):
+
+    def __init__(self, addresses, policy='block', timeout=None):
+        if policy not in POLICIES:
+            raise ValueError("Unrecognized policy: {}, available: {}".format(policy, POLICIES))
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        self.policy = policy
+        self.timeout = timeout
+        ctx = zmq.Context.instance()
+        self._sockets = []
+        self._poller = zmq.Poller()
+        for address in addresses:
+            socket = ctx.socket(zmq.DEALER)
+            socket.setsockopt(zmq.SNDHWM, 0)  # (credits bound the queue)
+            socket.connect(address)
+            socket.send(HELLO)
+            self._sockets.append(socket)
+            self._poller.register(socket, zmq.POLLIN)
+        self.credits = [0] * len(self._sockets)
+        self.windows = [0] * len(self._sockets)  # (each consumer's initial grant)
+        self.max_outstanding = 0  # (sent, not yet acknowledged: high-water mark)
+        self._acked = [False] * len(self._sockets)  # (consumer has taken our END)
+        self.n_sent = 0
+        self.n_dropped = 0
+        self.n_blocked = 0
+        self.t_blocked = 0.
+        t_start = timer()
+        while not all(self.credits):  # (handshake: every consumer has seen our hello)
+            if self.timeout is not None and timer() - t_start > self.timeout:
+                raise TimeoutError("No initial credit from consumers: {}".format(
+                    [a for a, c in zip(addresses, self.credits) if not c]))
+            self._take_credits(100)
+
+    def _take_credits(self, timeout_ms=0):
+        """ Collect credit grants (waiting up to timeout_ms, None: forever). """
+        for socket, _ in self._poller.poll(timeout_ms):
+            i = self._sockets.index(socket)
+            while True:
+                try:
+                    frames = socket.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                if frames[0] == END:
+                    self._acked[i] = True
+                elif frames[0] == CREDIT:
+                    n = N_CREDIT.unpack(frames[1])[0]
+                    if not self.windows[i]:
+                        self.windows[i] = n
+                    self.credits[i] += n
+
+    def send(self, arrays):
+        """ Returns True if sent, False if dropped (policy 'drop'). """
+        self._take_credits()
+        if not any(self.credits):
+            if self.policy == 'drop':
+                self.n_dropped += 1
+                return False
+            self.n_blocked += 1
+            t_start = timer()
+            while not any(self.credits):
+                remaining = None if self.timeout is None else self.timeout - (timer() - t_start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No credit from any consumer in {} s".format(self.timeout))
+                self._take_credits(None if remaining is None else int(remaining * 1000) + 1)
+            self.t_blocked += timer() - t_start
+        i = int(np.argmax(self.credits))
+        self.credits[i] -= 1
+        self.max_outstanding = max(self.max_outstanding, self.windows[i] - self.credits[i])
+        self._sockets[i].send_multipart([DATA] + pack_arrays(arrays), copy=False)
+        self.n_sent += 1
+        return True
+
+    def metrics(self):
+        return dict(sent=self.n_sent, dropped=self.n_dropped, blocked=self.n_blocked,
+                    blocked_time=self.t_blocked, credits=list(self.credits),
+                    max_outstanding=self.max_outstanding)
+
+    def close(self):
+        """ Send END, and wait (up to timeout) for each consumer to take it,
+        reading all its credits first: a socket closed with unread input is
+        reset, and the consumer can lose our last messages. """
+        for socket in self._sockets:
+            socket.send(END)
+        t_start = timer()
+        while not all(self._acked):
+            if self.timeout is not None and timer() - t_start > self.timeout:
+                break
+            self._take_credits(100)
+        for socket in self._sockets:
+            socket.close(linger=-1)
+
+
+class Consumer(object):
+
+    def __init__(self, address, window=16, credit_batch=None, n_producers=None):
+        self.window = window
+        self.n_producers = n_producers  # (if known: recv() returns None only after all end)
+        self.credit_batch = max(1, window // 4) if credit_batch is None else credit_batch
+        self._socket = zmq.Context.instance().socket(zmq.ROUTER)
+        self._socket.setsockopt(zmq.RCVHWM, 0)
+        self._socket.bind(address)
+        self.address = self._socket.getsockopt_string(zmq.LAST_ENDPOINT)
+        self._owed = defaultdict(int)  # producer -> credits consumed, not yet returned
+        self.n_received = 0
+        self.producers = set()
+        self.n_ended = 0
+
+    def _grant(self, producer, n):
+        self._socket.send_multipart([producer, CREDIT, N_CREDIT.pack(n)])
+
+    def recv(self, timeout=None):
+        """ Next message as (producer id, list of arrays), or None once every
+        producer has closed (all n_producers, else all that said hello). """
+        while True:
+            n_expected = len(self.producers) if self.n_producers is None else self.n_producers
+            if self.producers and self.n_ended == n_expected:
+                return None
+            if timeout is not None and not self._socket.poll(timeout * 1000):
+                raise TimeoutError
+            frames = self._socket.recv_multipart(copy=False)
+            producer, kind = frames[0].bytes, frames[1].bytes
+            if kind == DATA:
+                break
+            if kind == HELLO:
+                self.producers.add(producer)
+                self._grant(producer, self.window)
+            elif kind == END:
+                self.n_ended += 1
+                self._socket.send_multipart([producer, END])  # (ack: producer may close)
+        self._owed[producer] += 1
+        if self._owed[producer] >= self.credit_batch:
+            self._grant(producer, self._owed[producer])
+            self._owed[producer] = 0
+        self.n_received += 1
+        return producer, unpack_arrays(frames[2:])
+
+    def metrics(self):
+        return dict(received=self.n_received, window=self.window, producers=len(self.producers))
+
+    def close(self):
+        self._socket.close()
+
+
+###############################################################################
+# Demo: fast producers, slow consumer.                                       #
+###############################################################################
+
+
+def producer_main(address, policy, n_msg, size, results, rank):
+    producer = Producer([address], policy)
+    x = np.ones(size, dtype='float32')
+    for _ in range(n_msg):
+        producer.send([x])
+    m = producer.metrics()
+    results[rank] = (m['sent'], m['dropped'], m['blocked_time'], m['max_outstanding'])
+    producer.close()
+    zmq.Context.instance().term()
+
+
+def run(policy, n_prod, n_msg, size, window, work):
+    consumer = Consumer("tcp://127.0.0.1:*", window, n_producers=n_prod)
+    results = mp.Manager().dict()
+    procs = [mp.Process(target=producer_main, args=(consumer.address, policy, n_msg, size, results, r))
+             for r in range(n_prod)]
+    for p in procs:
+        p.start()
+    t_start = timer()
+    while consumer.recv() is not None:
+        time.sleep(work)  # (slow consumer)
+    t = timer() - t_start
+    for p in procs:
+        p.join()
+    consumer.close()
+    metrics = np.array(list(results.values()))
+    sent, dropped, blocked = metrics[:, :3].sum(axis=0)
+    max_outstanding = int(metrics[:, 3].max())
+    m = consumer.metrics()
+    print("{:<8}{:>10}{:>10}{:>10}{:>12.2f}{:>12}{:>12.0f}".format(
+        policy, int(sent), int(dropped), m['received'], blocked / n_prod, max_outstanding,
+        m['received'] / t))
+    sys.stdout.flush()
+
+
+def main(n_prod, n_msg, size, window, work):
+    print("{} producers x {} msgs of {} float32, window {}, consumer work {} ms/msg".format(
+        n_prod, n_msg, size, window, work * 1e3))
+    print("{:<8}{:>10}{:>10}{:>10}{:>12}{:>12}{:>12}".format(
+        "policy", "sent", "dropped", "received", "blocked (s)", "max queued", "msgs/s"))
+    for policy in POLICIES:
+        run(policy, n_prod, n_msg, size, window, work)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--n_prod', type=int, default=4)
+    parser.add_argument('-n', '--n_msg', type=int, default=500)
+    parser.add_argument('-s', '--size', type=int, default=100000)
+    parser.add_argument('-w', '--window', type=int, default=16)
+    parser.add_argument('--work', type=float, default=0.001, help="consumer seconds per message")
+    args = parser.parse_args()
+    main(args.n_prod, args.n_msg, args.size, args.window, args.work)
@@ -0,0 +1,263 @@
+
+"""
+Broadcast of large arrays to many same-host subscribers with one copy: the
+publisher writes each payload once into a slot of a named shared-memory
+segment and publishes only a small descriptor over zmq PUB/SUB (where
+np_pubsub.py and multi_pair.py push the whole array through the loopback
+stack once per subscriber).
+
+Subscribers map the segment read-only and get zero-copy views.  Each slot
+has one in-use flag per subscriber (its refcount is their sum); the
+publisher sets them all when publishing into the slot, each subscriber
+clears only its own on release(), and the publisher reuses a slot once all
+are clear.  (One writer per flag, so no lock or atomic is needed.)
+
+Usage:
+    pub = Publisher("tcp://127.0.0.1:5560", 'weights', n_subscribers=32,
+                    slot_bytes=params.nbytes)
+    pub.wait_ready()                      # (solves the PUB/SUB slow joiner)
+    pub.publish(params)
+    # ...in subscriber rank:
+    sub = Subscriber("tcp://127.0.0.1:5560", 'weights', rank)
+    seq, params = sub.recv()              # read-only view
+    ...
+    sub.release(seq)
+"""
+
+import os
+import sys
+import time
+import struct
+import argparse
+import multiprocessing as mp
+from timeit import default_timer as timer
+
+import numpy as np
+import zmq
+
+from array_msg import pack_header, unpack_header, send_array, recv_array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mp_speed'))
+from shmem import PAGE, shared_array, attach_array, unlink_array  # noqa: E402
+
+
+DESC = struct.Struct('<qi')  # (seq, slot)
+HELLO = -1  # (slot values of control descriptors)
+STOP = -2
+HELLO_INTERVAL = 0.01
+POLL_SLEEP = 1e-4
+
+
+class Publisher(object):
+
+    def __init__(self, address, name, n_subscribers, slot_bytes, n_slots=4):
+        self.name = name
+        self.n_subscribers = n_subscribers
+        self.n_slots = n_slots
+        self.slot_bytes = -(-slot_bytes // PAGE) * PAGE
+        self._data = shared_array(name + '_data', (n_slots, self.slot_bytes), 'uint8',
+                                  prefault=True)
+        self._refs = shared_array(name + '_refs', (n_slots + 1, n_subscribers), 'uint8',
+                                  prefault=False)  # (last row: subscriber ready flags)
+        self._socket = zmq.Context.instance().socket(zmq.PUB)
+        self._socket.bind(address)
+        self.address = self._socket.getsockopt_string(zmq.LAST_ENDPOINT)  # (if port was *)
+        self._seq = 0
+        self._next_slot = 0
+
+    @property
+    def refcounts(self):
+        return self._refs[:-1].sum(axis=1)
+
+    def wait_ready(self, timeout=None):
+        """ Publish hello descriptors until every subscriber has received
+        one (so none misses the first payload). """
+        t_start = timer()
+        while not self._refs[-1].all():
+            self._socket.send(DESC.pack(0, HELLO))
+            time.sleep(HELLO_INTERVAL)
+            if timeout is not None and timer() - t_start > timeout:
+                raise TimeoutError("Subscribers not ready: {}".format(
+                    np.where(self._refs[-1] == 0)[0].tolist()))
+
+    def publish(self, x, timeout=None):
+        """ Copy x into a free slot and publish its descriptor; returns the
+        sequence number.  Blocks while all slots are held. """
+        x = np.asarray(x)
+        if x.nbytes > self.slot_bytes:
+            raise ValueError("Array of {} bytes exceeds slot_bytes: {}".format(x.nbytes, self.slot_bytes))
+        slot = self._free_slot(timeout)
+        dest = self._data[slot, :x.nbytes].view(x.dtype).reshape(x.shape)
+        np.copyto(dest, x)
+        self._refs[slot] = 1
+        seq = self._seq
+        self._seq += 1
+        self._socket.send_multipart([DESC.pack(seq, slot), pack_header([x], False)])
+        return seq
+
+    def _free_slot(self, timeout):
+        t_start = timer()
+        while True:
+            for i in range(self.n_slots):
+                slot = (self._next_slot + i) % self.n_slots
+                if not self._refs[slot].any():
+                    self._next_slot = slot + 1
+                    return slot
+            if timeout is not None and timer() - t_start > timeout:
+                raise TimeoutError("No free slot, refcounts: {}".format(self.refcounts.tolist()))
+            time.sleep(POLL_SLEEP)
+
+    def close(self):
+        """ Tell subscribers to stop, and unlink the segments (mappings stay
+        valid until each process drops them). """
+        self._socket.send(DESC.pack(self._seq, STOP))
+        self._socket.close(linger=1000)
+        unlink_array(self.name + '_data')
+        unlink_array(self.name + '_refs')
+
+
+class Subscriber(object):
+
+    def __init__(self, address, name, rank):
+        self.rank = rank
+        self._socket = zmq.Context.instance().socket(zmq.SUB)
+        self._socket.setsockopt(zmq.SUBSCRIBE, b'')
+        self._socket.connect(address)
+        self._data = attach_array(name + '_data', readonly=True)
+        self._refs = attach_array(name + '_refs')
+        self._held = dict()  # seq -> slot
+
+    def recv(self, timeout=None):
+        """ Next payload as (seq, read-only view), or None once the
+        publisher has closed.  Call release(seq) when done with the view. """
+        while True:
+            if timeout is not None and not self._socket.poll(timeout * 1000):
+                raise TimeoutError
+            frames = self._socket.recv_multipart()
+            seq, slot = DESC.unpack(frames[0])
+            if slot != HELLO:
+                break
+            self._refs[-1, self.rank] = 1
+        if slot == STOP:
+            return None
+        _, [(dtype, shape)] = unpack_header(frames[1])
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        self._held[seq] = slot
+        return seq, self._data[slot, :nbytes].view(dtype).reshape(shape)
+
+    def release(self, seq=None):
+        """ Done with the view of payload seq (default: all held). """
+        seqs = list(self._held) if seq is None else [seq]
+        for s in seqs:
+            self._refs[self._held.pop(s), self.rank] = 0
+
+    def close(self):
+        self.release()
+        self._socket.close()
+
+
+###############################################################################
+# Benchmark: one payload to n subscribers, zmq PUB/SUB vs. shared memory.    #
+###############################################################################
+
+
+def zmq_subscriber(address, ack_address, n_msg):
+    ctx = zmq.Context.instance()
+    sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b'')
+    sub.connect(address)
+    ack = ctx.socket(zmq.PUSH)
+    ack.connect(ack_address)
+    ack.send(b'')  # (connected)
+    for _ in range(n_msg):
+        x = recv_array(sub)
+        x[0]  # (touch)
+        ack.send(b'')
+    sub.close()
+    ack.close()
+    ctx.term()
+
+
+def shm_subscriber(address, ack_address, name, rank, n_msg):
+    ctx = zmq.Context.instance()
+    sub = Subscriber(address, name, rank)
+    ack = ctx.socket(zmq.PUSH)
+    ack.connect(ack_address)
+    for _ in range(n_msg):
+        seq, x = sub.recv()
+        x[0]  # (touch)
+        sub.release(seq)
+        ack.send(b'')
+    sub.close()
+    ack.close()
+    ctx.term()
+
+
+def time_zmq(n_sub, x, n_msg):
+    ctx = zmq.Context.instance()
+    pub = ctx.socket(zmq.PUB)
+    address = "tcp://127.0.0.1:{}".format(pub.bind_to_random_port("tcp://127.0.0.1"))
+    ack = ctx.socket(zmq.PULL)
+    ack_address = "tcp://127.0.0.1:{}".format(ack.bind_to_random_port("tcp://127.0.0.1"))
+    procs = [mp.Process(target=zmq_subscriber, args=(address, ack_address, n_msg)) for _ in range(n_sub)]
+    for p in procs:
+        p.start()
+    for _ in range(n_sub):
+        ack.recv()
+    time.sleep(0.5)  # (slow joiner: no hello protocol here)
+    times = []
+    for _ in range(n_msg):
+        t_start = timer()
+        send_array(pub, x)
+        for _ in range(n_sub):
+            ack.recv()
+        times.append(timer() - t_start)
+    for p in procs:
+        p.join()
+    pub.close()
+    ack.close()
+    return np.median(times)
+
+
+def time_shm(n_sub, x, n_msg):
+    ctx = zmq.Context.instance()
+    name = 'bcast_bench_{}'.format(os.getpid())
+    pub = Publisher("tcp://127.0.0.1:*", name, n_sub, x.nbytes)
+    ack = ctx.socket(zmq.PULL)
+    ack_address = "tcp://127.0.0.1:{}".format(ack.bind_to_random_port("tcp://127.0.0.1"))
+    procs = [mp.Process(target=shm_subscriber, args=(pub.address, ack_address, name, rank, n_msg))
+             for rank in range(n_sub)]
+    for p in procs:
+        p.start()
+    pub.wait_ready()
+    times = []
+    for _ in range(n_msg):
+        t_start = timer()
+        pub.publish(x)
+        for _ in range(n_sub):
+            ack.recv()
+        times.append(timer() - t_start)
+    for p in procs:
+        p.join()
+    pub.close()
+    ack.close()
+    return np.median(times)
+
+
+def main(n_subs, size_mb, n_msg):
+    x = np.ones(size_mb * 1024 * 1024 // 4, dtype='float32')
+    print("Broadcast {} MB, median time until all subscribers have it (ms)".format(size_mb))
+    print("{:<14}".format("n_sub:") + "".join(["{:>10}".format(n) for n in n_subs]))
+    for name, run in [('zmq PUB/SUB', time_zmq), ('shm + zmq', time_shm)]:
+        times = [run(n, x, n_msg) for n in n_subs]
+        print("{:<14}".format(name) + "".join(["{:>10.1f}".format(t * 1e3) for t in times]))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--n_subs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('-s', '--size_mb', type=int, default=40)
+    parser.add_argument('-i', '--n_msg', type=int, default=10)
+    args = parser.parse_args()
+    main(args.n_subs, args.size_mb, args.n_msg)